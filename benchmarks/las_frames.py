@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the time needed to build the frames sent by the LAS replayer, using the previous
+implementation (`DataFrame.iterrows` and `read_next_frame`) and `build_frames`.
+Requires `pip install live-agent[las]`.
+
+Usage: python benchmarks/las_frames.py [--rows 5000]
+"""
+
+import json
+import time
+import argparse
+
+import lasio
+import numpy as np
+
+from live_agent.modules.las.datasources.las_replayer import build_frames
+
+INDEX_MNEMONIC = "TIME"
+
+
+def legacy_read_next_frame(values_iterator, curves, curves_data, index_mnemonic):
+    try:
+        index, values = next(values_iterator)
+        success = True
+    except Exception:
+        output_frame = {}
+        success = False
+
+    if success:
+        output_frame = {index_mnemonic: {"value": index, "uom": "s"}}
+
+        for index, channel in enumerate(curves):
+            uom = curves_data.get(channel)
+            channel_value = values.iloc[index]
+            output_frame[channel] = {"value": channel_value, "uom": uom}
+
+    return success, output_frame
+
+
+def build_las(num_rows, num_curves):
+    las_data = lasio.LASFile()
+    las_data.append_curve(INDEX_MNEMONIC, np.arange(num_rows, dtype=float), unit="s")
+    for index in range(num_curves):
+        values = np.random.random(num_rows) * 100
+        values[::17] = np.nan
+        las_data.append_curve(f"CURVE{index}", values, unit="m")
+
+    return las_data
+
+
+def run_legacy(las_data):
+    curves_data = dict((item.mnemonic, item.unit) for item in las_data.curves)
+    las_df = las_data.df()
+    values_iterator = las_df.iterrows()
+    curves = las_df.columns
+
+    frames = []
+    success = True
+    while success:
+        success, frame = legacy_read_next_frame(
+            values_iterator, curves, curves_data, INDEX_MNEMONIC
+        )
+        if success:
+            frames.append(frame)
+
+    return frames
+
+
+def run_vectorized(las_data):
+    return list(build_frames(las_data, INDEX_MNEMONIC))
+
+
+def same_frames(frames, other_frames):
+    # NaN != NaN, so the frames are compared as they would be sent
+    return json.dumps(frames) == json.dumps(other_frames)
+
+
+def run(num_rows):
+    print(f"{'curves':>8}{'legacy (fr/s)':>16}{'vectorized (fr/s)':>20}{'speedup':>10}")
+    for num_curves in (5, 20, 80):
+        las_data = build_las(num_rows, num_curves)
+        timings = []
+        results = []
+        for runner in (run_legacy, run_vectorized):
+            started_at = time.perf_counter()
+            results.append(runner(las_data))
+            timings.append(time.perf_counter() - started_at)
+
+        assert same_frames(*results), "Different frames"
+        legacy_rate, vectorized_rate = [num_rows / item for item in timings]
+        print(
+            f"{num_curves:>8}{legacy_rate:>16.0f}{vectorized_rate:>20.0f}"
+            f"{vectorized_rate / legacy_rate:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the frames of the LAS replayer")
+    parser.add_argument("--rows", type=int, default=5000, help="Number of rows on the LAS file")
+    args = parser.parse_args()
+    run(args.rows)
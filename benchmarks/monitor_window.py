@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the time needed to keep the window of a monitor updated, using the previous
+implementation of `refresh_accumulator` (which rebuilds the window on every event)
+and `EventWindow`.
+
+Usage: python benchmarks/monitor_window.py [--events 20000]
+"""
+
+import time
+import argparse
+
+from live_agent.services.monitors.utils.window import EventWindow
+
+INDEX_MNEMONIC = "timestamp"
+
+
+def legacy_refresh_accumulator(latest_events, accumulator, index_mnemonic, window_duration):
+    latest_event = latest_events[-1]
+    window_end = latest_event.get(index_mnemonic, 0)
+    window_start = window_end - window_duration
+    last_index = window_start
+
+    accumulator.extend(latest_events)
+    purged_accumulator = []
+    for item in accumulator:
+        index = item.get(index_mnemonic, 0)
+        if (window_start <= index <= window_end) and (index >= last_index):
+            purged_accumulator.append(item)
+            last_index = index
+        elif index < last_index:
+            purged_accumulator = [item]
+            last_index = index
+
+    return purged_accumulator, window_start, window_end
+
+
+def build_events(num_events, rate):
+    # `rate` events per second, with an index regression (a new run) halfway
+    events = []
+    for index in range(num_events):
+        if index < num_events // 2:
+            timestamp = index / rate
+        else:
+            timestamp = (index - num_events // 2) / rate
+
+        events.append({INDEX_MNEMONIC: timestamp, "rop": index % 97, "torque": index % 13})
+
+    return events
+
+
+def run_legacy(events, window_duration):
+    accumulator = []
+    for event in events:
+        accumulator, start, end = legacy_refresh_accumulator(
+            [event], accumulator, INDEX_MNEMONIC, window_duration
+        )
+
+    return accumulator[-1]
+
+
+def run_window(events, window_duration):
+    window = EventWindow(index_mnemonic=INDEX_MNEMONIC, window_duration=window_duration)
+    for event in events:
+        window.extend([event])
+
+    return window[-1]
+
+
+def run(num_events):
+    print(f"{'rate':>6}{'window (s)':>12}{'legacy (ev/s)':>16}{'deque (ev/s)':>16}{'speedup':>10}")
+    for rate in (1, 10):
+        for window_duration in (60, 600, 3600):
+            events = build_events(num_events, rate)
+            timings = []
+            results = []
+            for runner in (run_legacy, run_window):
+                started_at = time.perf_counter()
+                results.append(runner(events, window_duration))
+                timings.append(time.perf_counter() - started_at)
+
+            assert results[0] == results[1], f"Different windows: {results}"
+            legacy_rate, window_rate = [num_events / item for item in timings]
+            print(
+                f"{rate:>6}{window_duration:>12}{legacy_rate:>16.0f}{window_rate:>16.0f}"
+                f"{window_rate / legacy_rate:>9.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the monitors' window")
+    parser.add_argument("--events", type=int, default=20000, help="Number of events")
+    args = parser.parse_args()
+    run(args.events)
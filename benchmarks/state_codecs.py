@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the latency of saving and loading states and the size of the stored data,
+for each state codec and backend.
+
+Usage: python benchmarks/state_codecs.py [--repeat 200]
+"""
+
+import time
+import random
+import argparse
+import tempfile
+import uuid
+
+from live_agent.services import codecs
+from live_agent.services.state import StateManager, STATE_STORES
+
+
+def build_states():
+    rooms = [str(uuid.uuid4()) for _ in range(50)]
+    assets = [
+        {"id": index, "name": f"asset-{index}", "type": "rig", "tags": ["drilling", "offshore"]}
+        for index in range(200)
+    ]
+    trades = dict(
+        (
+            pair,
+            {
+                "channel_id": index,
+                "operations": [
+                    {
+                        "price": f"{random.uniform(1, 50000):.5f}",
+                        "volume": f"{random.uniform(0, 10):.8f}",
+                        "time": f"{time.time():.6f}",
+                        "side": random.choice("bs"),
+                        "orderType": random.choice("lm"),
+                        "misc": "",
+                    }
+                    for _ in range(20)
+                ],
+                "operation_type": "trade",
+                "pair": pair,
+            },
+        )
+        for index, pair in enumerate(["XBT/USD", "XBT/EUR", "ETH/USD", "ETH/EUR"])
+    )
+
+    return {
+        "las_replayer": {"last_timestamp": 1584047640000, "iterations": 12},
+        "chatbot": {"bots_registry": dict((room_id, (None, None)) for room_id in rooms)},
+        "room_bot": {
+            "bot_state": {
+                "asset-list": {
+                    "assets": assets,
+                    "asset_names": [item["name"] for item in assets],
+                },
+                "monitor-control": {"active_monitors": ["rop", "torque", "pressure"]},
+            }
+        },
+        "krakenfx": {"last_trades": trades},
+    }
+
+
+def list_codecs():
+    available_codecs = []
+    for name in codecs.CODECS:
+        try:
+            codecs.get_codec(name)
+        except ValueError:
+            print(f"Skipping {name}, which is not available")
+        else:
+            available_codecs.append(name)
+
+    return available_codecs
+
+
+def measure(state_name, state, backend, codec, directory, repeat):
+    state_manager = StateManager(
+        f"benchmark-{state_name}", directory=directory, backend=backend, codec=codec
+    )
+    try:
+        state_manager.do_save(dict(state), timestamp=0)
+    except (TypeError, ValueError):
+        return None
+
+    started_at = time.perf_counter()
+    for index in range(repeat):
+        state_manager.do_save(dict(state), timestamp=index)
+    save_time = (time.perf_counter() - started_at) / repeat
+
+    started_at = time.perf_counter()
+    for index in range(repeat):
+        state_manager.store.load()
+    load_time = (time.perf_counter() - started_at) / repeat
+
+    size = len(codecs.encode(state, codec))
+    return save_time, load_time, size
+
+
+def run(repeat):
+    states = build_states()
+    available_codecs = list_codecs()
+
+    print(f"{'state':<14}{'backend':<9}{'codec':<9}{'save (ms)':>11}{'load (ms)':>11}{'bytes':>9}")
+    for state_name, state in states.items():
+        for backend in STATE_STORES:
+            for codec in available_codecs:
+                with tempfile.TemporaryDirectory() as directory:
+                    result = measure(state_name, state, backend, codec, directory, repeat)
+
+                if result is None:
+                    print(f"{state_name:<14}{backend:<9}{codec:<9}{'not supported':>31}")
+                    continue
+
+                save_time, load_time, size = result
+                print(
+                    f"{state_name:<14}{backend:<9}{codec:<9}"
+                    f"{save_time * 1000:>11.3f}{load_time * 1000:>11.3f}{size:>9}"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the state codecs")
+    parser.add_argument("--repeat", type=int, default=200, help="Iterations for each measure")
+    args = parser.parse_args()
+    run(args.repeat)
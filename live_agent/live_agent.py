@@ -2,12 +2,14 @@
 import os
 import signal
 import json
+from multiprocessing import active_children
 
 from eliot import start_action, to_file, Action
 from setproctitle import setproctitle
 
 from live_client.utils import logging
-from .services import processes, daemon
+from .services import processes, daemon, tracing
+from .services.log_writer import to_buffered_file
 
 __all__ = ["LiveAgent"]
 
@@ -17,33 +19,53 @@ DEFAULT_PIDFILE = "/var/run/live-agent.pid"
 LOGFILE_ENVVAR = "DDA_LOG_FILE"
 DEFAULT_LOG = "/var/log/live-agent.log"
 
+# Time for the main process to stop its children before being killed
+SHUTDOWN_MARGIN = 5
+
 
 class LiveAgent(daemon.Daemon):
     def __init__(self, pidfile, settings_file):
         setproctitle("DDA:  Main process")
-        self.configure_log()
         self.settings_file = settings_file
+        self.configure_log()
 
         with start_action(action_type="init_daemon") as action:
             task_id = action.serialize_task_id()
             error_logfile = f"{self.logfile}.error"
             return super().__init__(
-                pidfile, stdout=self.logfile, stderr=error_logfile, task_id=task_id
+                pidfile,
+                stdout=self.logfile,
+                stderr=error_logfile,
+                task_id=task_id,
+                stop_timeout=self.stop_timeout,
             )
 
+    def load_settings(self):
+        with open(self.settings_file, "r") as fd:
+            return json.load(fd)
+
+    @property
+    def stop_timeout(self):
+        try:
+            supervisor_settings = self.load_settings().get("supervisor", {})
+        except Exception:
+            supervisor_settings = {}
+
+        return supervisor_settings.get("shutdown_timeout", 10) + SHUTDOWN_MARGIN
+
     def run(self):
         with Action.continue_task(task_id=self.task_id):
             try:
-                with open(self.settings_file, "r") as fd:
-                    global_settings = json.load(fd)
+                global_settings = self.load_settings()
 
                 logging_settings = global_settings.get("logging")
                 live_settings = global_settings.get("live")
 
                 logging.setup_python_logging(logging_settings)
                 logging.setup_live_logging(logging_settings, live_settings)
+                tracing.configure(logging_settings)
 
-                agent_processes = processes.start(global_settings)
+                agent_processes = processes.start(global_settings, settings_file=self.settings_file)
             except KeyboardInterrupt:
                 logging.info("Execution interrupted")
                 raise
@@ -51,16 +73,33 @@ class LiveAgent(daemon.Daemon):
                 logging.exception("Error processing inputs")
                 raise
 
-        for item in agent_processes:
+        logging.info(f"{len(agent_processes)} processes stopped")
+
+        # Processes not managed by the supervisor, like the remote logger
+        for item in active_children():
             item.terminate()
-            item.join()
+            item.join(SHUTDOWN_MARGIN)
 
     @property
     def logfile(self):
         return os.environ.get(LOGFILE_ENVVAR, DEFAULT_LOG)
 
     def configure_log(self):
-        to_file(open(self.logfile, "ab"))
+        try:
+            logging_settings = self.load_settings().get("logging", {})
+        except Exception:
+            logging_settings = {}
+
+        buffer_settings = logging_settings.get("buffer", {})
+        logfile = open(self.logfile, "ab")
+
+        if buffer_settings.get("enabled", True):
+            buffer_settings = dict(
+                (key, value) for (key, value) in buffer_settings.items() if key != "enabled"
+            )
+            to_buffered_file(logfile, **buffer_settings)
+        else:
+            to_file(logfile)
 
 
 def init_worker():
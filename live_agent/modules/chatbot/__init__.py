@@ -1,4 +1,14 @@
 # -*- coding: utf-8 -*-
-from .monitors import chatbot
-
-PROCESSES = {"chatterbot": chatbot.start}
+PROCESSES = {"chatterbot": "live_agent.modules.chatbot.monitors.chatbot:start"}
+PRELOAD = [
+    "chatterbot",
+    "chatterbot.corpus",
+    "chatterbot.storage",
+    "chatterbot.trainers",
+    "nltk",
+    "jinja2",
+    "live_agent.modules.chatbot.logic_adapters.internal",
+    "live_agent.modules.chatbot.logic_adapters.live",
+    "live_agent.modules.chatbot.logic_adapters.monitors",
+    "live_agent.modules.chatbot.logic_adapters.variables",
+]
@@ -2,7 +2,6 @@
 from pprint import pformat
 from chatterbot.logic import LogicAdapter
 from chatterbot.conversation import Statement
-from eliot import start_action
 import nltk
 from nltk import NaiveBayesClassifier
 
@@ -10,6 +9,8 @@ from live_client.assets.curves import only_enabled_curves
 from live_client.utils import logging
 from live_client.query import on_event
 
+from live_agent.services import tracing
+
 
 __all__ = []
 
@@ -260,7 +261,7 @@ class WithAssetAdapter(WithStateAdapter):
         settings = self.settings
         timeout = self.query_timeout
 
-        with start_action(action_type=self.state_key, query=query_str):
+        with tracing.start_action(self.state_key, query=query_str):
 
             @on_event(query_str, settings, span=span, realtime=realtime, timeout=timeout)
             def handle_events(event, callback, *args, **kwargs):
@@ -5,7 +5,6 @@ import json
 from uuid import uuid4
 
 from chatterbot.conversation import Statement  # NOQA
-from eliot import start_action
 
 from live_client.events import annotation
 from live_client.assets import list_assets, fetch_asset_settings
@@ -15,6 +14,7 @@ from live_client.utils import logging
 from live_client.utils.timestamp import get_timestamp
 from live_client.events.constants import UOM_KEY, VALUE_KEY, TIMESTAMP_KEY
 
+from live_agent.services import tracing
 from live_agent.modules.chatbot.src.actions import CallbackAction, ShowTextAction
 from live_agent.modules.chatbot.logic_adapters.base import (
     BaseBayesAdapter,
@@ -229,7 +229,7 @@ class AutoAnalysisAdapter(BaseBayesAdapter, NLPAdapter, WithAssetAdapter):
             analysis_results.update(
                 __src="auto-analysis", uid=str(uuid4()), createdAt=get_timestamp()
             )
-            with start_action(action_type="create annotation", curve=curve):
+            with tracing.start_action("create annotation", curve=curve):
                 self.annotator(analysis_results, room={"id": self.room_id})
 
             response_text = "Analysis of curve {} finished".format(curve)
@@ -248,7 +248,7 @@ class AutoAnalysisAdapter(BaseBayesAdapter, NLPAdapter, WithAssetAdapter):
 
             ##
             # Iniciar analise
-            with start_action(action_type=self.state_key, curve=selected_curve):
+            with tracing.start_action(self.state_key, curve=selected_curve):
                 response_text = self.run_analysis(selected_asset, selected_curve)
 
         elif num_selected_curves == 0:
@@ -387,7 +387,7 @@ class CurrentValueQueryAdapter(BaseBayesAdapter, NLPAdapter, WithAssetAdapter):
         elif num_selected_curves == 1:
             selected_curve = selected_curves[0]
 
-            with start_action(action_type=self.state_key, curve=selected_curve):
+            with tracing.start_action(self.state_key, curve=selected_curve):
                 response_text = self.run_query(selected_curve)
 
         else:
@@ -108,7 +108,12 @@ class MonitorControlAdapter(BaseBayesAdapter, WithAssetAdapter):
             logging.debug(f"Starting {name}")
             try:
                 process_func = self.process_handlers.get(process_type)
-                process_func = agent_function(process_func, name=name, with_state=True)
+                process_func = agent_function(
+                    process_func,
+                    name=name,
+                    with_state=True,
+                    scheduling_settings=monitor_settings.get("scheduling"),
+                )
                 process = process_func(monitor_settings, name=name)
                 active_monitors[name] = process
                 process.start()
@@ -2,7 +2,6 @@
 from multiprocessing import Queue, active_children
 from functools import partial
 
-from eliot import start_action
 from setproctitle import setproctitle
 from chatterbot.trainers import ChatterBotCorpusTrainer
 
@@ -12,6 +11,7 @@ from live_client.facades import LiveClient
 from live_client.types.message import Message
 from live_client.utils import logging
 
+from live_agent.services import metrics, tracing
 from live_agent.services.processes import agent_function
 
 from live_agent.modules.chatbot.src.bot import ChatBot
@@ -71,7 +71,7 @@ def process_messages(chatbot, messages):
     room_id = chatbot.context.get("room_id")
 
     for message in messages:
-        with start_action(action_type="process_message", message=message.get("text")):
+        with tracing.start_action("process_message", message=message.get("text")):
             is_mention, message = maybe_mention(settings, message)
 
             response = None
@@ -99,6 +99,7 @@ def maybe_send_message(settings, room_id, response_message):
     messenger.send_message(
         response_message, settings=bot_settings, message_type=messenger.MESSAGE_TYPES.CHAT
     )
+    metrics.inc("events_emitted_total")
 
 
 ##
@@ -162,7 +163,7 @@ def add_bot(settings, bots_registry, room_id):
             start_chatbot_with_log = agent_function(
                 start_chatbot, name=f"bot for room {room_id}", with_state=True
             )
-            with start_action(action_type="start_chatbot", room_id=room_id) as action:
+            with tracing.start_action("start_chatbot", room_id=room_id) as action:
                 task_id = action.serialize_task_id()
                 room_queue = Queue()
                 room_bot = start_chatbot_with_log(settings, room_id, room_queue, task_id=task_id)
@@ -175,6 +176,7 @@ def add_bot(settings, bots_registry, room_id):
 
 def route_message(settings, bots_registry, event):
     logging.debug("Got an event: {}".format(event))
+    metrics.inc("events_received_total")
 
     messages = maybe_extract_messages(event)
     for message in messages:
@@ -189,6 +191,11 @@ def route_message(settings, bots_registry, event):
         room_bot, room_queue = bots_registry.get(room_id, (None, None))
         room_queue.put(event)
 
+    queue_depth = sum(
+        room_queue.qsize() for room_bot, room_queue in bots_registry.values() if room_queue
+    )
+    metrics.set_gauge("queue_depth", queue_depth)
+
     return [item[0] for item in bots_registry.values()]
 
 
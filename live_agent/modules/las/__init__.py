@@ -1,4 +1,3 @@
 # -*- coding: utf-8 -*-
-from .datasources import las_replayer
-
-PROCESSES = {"las_replay": las_replayer.start}
+PROCESSES = {"las_replay": "live_agent.modules.las.datasources.las_replayer:start"}
+PRELOAD = ["lasio", "pandas"]
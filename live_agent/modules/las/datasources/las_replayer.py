@@ -7,6 +7,7 @@ import lasio
 
 from live_client.events import raw, messenger
 from live_client.utils import timestamp, logging
+from live_agent.services import metrics
 
 from ..utils import loop
 
@@ -15,6 +16,12 @@ __all__ = ["start"]
 
 READ_MODES = Enum("READ_MODES", "SINGLE_PASS, CONTINUOUS")
 
+# Lag (in seconds) after which the replay is reported as behind schedule
+LAG_WARNING_THRESHOLD = 10
+
+# Rows of the LAS file converted to python values at a time
+FRAMES_CHUNK_SIZE = 4096
+
 
 def update_chat(chat, last_ts, next_ts, index_mnemonic, settings):
     if not chat:
@@ -45,33 +52,33 @@ def send_message(message, timestamp, settings=None):
     messenger.maybe_send_chat_message(message, timestamp, settings)
 
 
-def delay_output(last_timestamp, next_timestamp):
-    if last_timestamp == 0:
-        sleep_time = 0
-    else:
-        sleep_time = max(next_timestamp - last_timestamp, 0)
-
-    loop.await_next_cycle(sleep_time)
-
+def build_frames(las_data, index_mnemonic):
+    """
+    Yields a frame for each row of the LAS file, built from the array with the values of all
+    curves (instead of iterating over the rows of the dataframe, which is much slower).
+    The values are converted `FRAMES_CHUNK_SIZE` rows at a time, so large files are not
+    duplicated as python objects while they are replayed.
+    """
+    curves_data = dict((item.mnemonic, item.unit) for item in las_data.curves)
+    las_df = las_data.df()
+    channels = list(las_df.columns)
+    uoms = [curves_data.get(channel) for channel in channels]
+    index_array = las_df.index.to_numpy()
+    values_array = las_df.to_numpy()
 
-def read_next_frame(values_iterator, curves, curves_data, index_mnemonic):
-    try:
-        index, values = next(values_iterator)
-        success = True
-    except Exception as e:
-        output_frame = {}
-        success = False
-        logging.debug("Error reading next value, {}<{}>".format(e, type(e)))
+    for start in range(0, len(las_df), FRAMES_CHUNK_SIZE):
+        end = start + FRAMES_CHUNK_SIZE
 
-    if success:
-        output_frame = {index_mnemonic: {"value": index, "uom": "s"}}
+        # `tolist` converts all the values on the chunk to python types at once
+        index_values = index_array[start:end].tolist()
+        rows = values_array[start:end].tolist()
 
-        for index, channel in enumerate(curves):
-            uom = curves_data.get(channel)
-            channel_value = values[index]
-            output_frame[channel] = {"value": channel_value, "uom": uom}
+        for index, values in zip(index_values, rows):
+            frame = {index_mnemonic: {"value": index, "uom": "s"}}
+            for channel, uom, value in zip(channels, uoms, values):
+                frame[channel] = {"value": value, "uom": uom}
 
-    return success, output_frame
+            yield frame
 
 
 def open_files(settings, iterations, mode=READ_MODES.CONTINUOUS):
@@ -111,31 +118,33 @@ def generate_events(event_type, las_data, chat_data, index_mnemonic, settings, s
     logging.info("{}: Event generation started".format(event_type))
 
     source_name = las_data.version.SOURCE.value
-    curves_data = dict((item.mnemonic, item.unit) for item in las_data.curves)
-    las_df = las_data.df()
-    values_iterator = las_df.iterrows()
-    curves = las_df.columns
+    scheduler = loop.ReplayScheduler(speed=settings.get("speed", 1))
+    is_behind_schedule = False
 
-    success = True
     state = state_manager.load()
     last_timestamp = state.get("last_timestamp", 0)
     if last_timestamp > 0:
         logging.info(f"Skipping to index {last_timestamp}")
 
-    while success:
-        success, statuses = read_next_frame(values_iterator, curves, curves_data, index_mnemonic)
-
-        if success:
-            next_timestamp = statuses.get(index_mnemonic, {}).get("value", 0)
+    for statuses in build_frames(las_data, index_mnemonic):
+        next_timestamp = statuses[index_mnemonic]["value"]
 
         if next_timestamp > last_timestamp:
-            delay_output(last_timestamp, next_timestamp)
+            lag = scheduler.wait(next_timestamp)
+            metrics.set_gauge("replay_lag_seconds", lag)
+            if (lag > LAG_WARNING_THRESHOLD) != is_behind_schedule:
+                is_behind_schedule = not is_behind_schedule
+                if is_behind_schedule:
+                    logging.warn(f"{event_type}: Replay is {lag:.1f}s behind schedule")
+                else:
+                    logging.info(f"{event_type}: Replay is back on schedule")
 
             if last_timestamp == 0:
                 message = "Replay from '{}' started at TIME {}".format(source_name, next_timestamp)
                 send_message(message, timestamp.get_timestamp(), settings=settings)
 
             raw.create(event_type, statuses, settings)
+            metrics.inc("events_emitted_total")
 
             update_chat(chat_data, last_timestamp, next_timestamp, index_mnemonic, settings)
             last_timestamp = next_timestamp
@@ -162,6 +171,7 @@ def start(settings, **kwargs):
         "type": "las_replay",
         "enabled": true,  # Self explanatory
         "index_mnemonic": "TIME",  # Curve used as index for the LAS data
+        "speed": 1,  # Multiplier for the replay speed, or "max" to replay as fast as possible
         "path_list": [
           # A list of filename pairs containing the data to be replayed
           [<path for a LAS file>, <path for a CSV file containing the chat logs>],
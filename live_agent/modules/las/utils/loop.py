@@ -3,7 +3,10 @@ import time
 
 from live_client.utils import logging
 
-__all__ = ["await_next_cycle"]
+__all__ = ["await_next_cycle", "ReplayScheduler"]
+
+# The speed used to replay as fast as possible
+MAX_SPEED = "max"
 
 
 def await_next_cycle(sleep_time, message=None, log_func=None):
@@ -15,3 +18,43 @@ def await_next_cycle(sleep_time, message=None, log_func=None):
 
     log_func(message)
     time.sleep(sleep_time)
+
+
+class ReplayScheduler:
+    """
+    Waits until the time of each frame of a replay, keeping the pace of the index of the data
+    (multiplied by `speed`, or as fast as possible when `speed` is "max").
+
+    The deadlines are absolute (relative to the first frame, on the monotonic clock), so the time
+    spent processing each frame does not accumulate as drift. `lag` is how many seconds
+    the replay is behind schedule, which is recovered by not waiting for the next frames.
+    """
+
+    def __init__(self, speed=1):
+        if (speed != MAX_SPEED) and not (isinstance(speed, (int, float)) and speed > 0):
+            raise ValueError(f'Invalid speed {speed}, should be a positive number or "{MAX_SPEED}"')
+
+        self.speed = speed
+        self.started_at = None
+        self.first_index = None
+        self.lag = 0.0
+
+    def wait(self, index):
+        """
+        Waits until the deadline for the frame at `index` and returns the lag
+        """
+        now = time.monotonic()
+        if self.started_at is None:
+            self.started_at = now
+            self.first_index = index
+
+        if self.speed == MAX_SPEED:
+            return self.lag
+
+        deadline = self.started_at + (index - self.first_index) / self.speed
+        time_until_deadline = deadline - now
+        if time_until_deadline > 0:
+            time.sleep(time_until_deadline)
+
+        self.lag = max(-time_until_deadline, 0.0)
+        return self.lag
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+from contextvars import copy_context
+from copy import deepcopy
+from time import monotonic
+from typing import Mapping, Callable
+
+from setproctitle import setproctitle
+from live_client.utils import logging
+
+from .importer import load_handler
+from .processes import ProcessSpec, mark_started, schedule_restart
+from .state import StateManager
+from . import metrics, tracing
+
+__all__ = ["start"]
+
+
+def start(settings: Mapping, **kwargs) -> None:
+    """
+    Runs the processes configured with `"execution": "async"` as tasks on a shared event loop.
+
+    Coroutine functions are executed directly by the event loop. Other process functions are
+    executed on threads of this worker, since they would block the event loop.
+    Each process has its own `StateManager` and is restarted according to its `restart_policy`.
+    """
+    setproctitle("DDA: Async worker")
+    process_map = settings.get("processes", {})
+    logging.info(
+        "Async worker started with {} processes: {}".format(
+            len(process_map), ", ".join(process_map.keys())
+        )
+    )
+
+    asyncio.run(run_processes(process_map))
+
+
+async def run_processes(process_map: Mapping) -> None:
+    await asyncio.gather(*(supervise(name, data) for name, data in process_map.items()))
+
+
+async def supervise(name: str, process_data: ProcessSpec) -> None:
+    while True:
+        await asyncio.sleep(max(process_data.next_start_at - monotonic(), 0))
+
+        mark_started(name, process_data)
+        process_data.process = asyncio.current_task()
+        await run_process(name, process_data)
+
+        logging.info(f'Task for "{name}" has finished')
+        schedule_restart(name, process_data)
+
+
+async def run_process(name: str, process_data: ProcessSpec) -> None:
+    settings = deepcopy(process_data.settings)
+    metrics.bind(name, process_wide=False)
+
+    with tracing.start_action(name) as action:
+        state_manager = StateManager(name)
+        kwargs = dict(task_id=action.serialize_task_id(), state_manager=state_manager)
+
+        try:
+            process_func = load_handler(process_data.function)
+            if asyncio.iscoroutinefunction(process_func):
+                await process_func(settings, **kwargs)
+            else:
+                await run_in_thread(process_func, settings, **kwargs)
+        except Exception as e:
+            logging.exception(f"Error during the execution of {process_data.function}: <{e}>")
+        finally:
+            state_manager.flush()
+
+
+def run_in_thread(f: Callable, *args, **kwargs) -> asyncio.Future:
+    """
+    Runs a blocking function on a daemon thread, so it does not prevent the worker from exiting
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    context = copy_context()
+
+    def set_result(result=None, error=None):
+        if future.cancelled():
+            return
+        elif error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def target():
+        try:
+            outcome = (context.run(f, *args, **kwargs), None)
+        except Exception as e:
+            outcome = (None, e)
+
+        try:
+            loop.call_soon_threadsafe(set_result, *outcome)
+        except RuntimeError:
+            # The event loop is already closed
+            pass
+
+    threading.Thread(target=target, name=f"{f.__module__}.{f.__name__}", daemon=True).start()
+    return future
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import json
+import pickle
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import dill
+
+__all__ = ["encode", "decode", "get_codec"]
+
+# Encoded values start with the magic bytes and the id of the codec.
+# Pickled values (as the ones saved by older versions, using dill) never start with a null byte.
+HEADER_MAGIC = b"\x00LA"
+HEADER_SIZE = len(HEADER_MAGIC) + 1
+PICKLE_PROTOCOL = min(5, pickle.HIGHEST_PROTOCOL)
+
+
+@dataclass
+class Codec:
+    id: int
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[bytes], Any]
+
+
+def msgpack_dumps(value: Any) -> bytes:
+    import msgpack
+
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def msgpack_loads(data: bytes) -> Any:
+    import msgpack
+
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+CODECS = {
+    "dill": Codec(id=1, dumps=dill.dumps, loads=dill.loads),
+    "pickle": Codec(
+        id=2, dumps=lambda value: pickle.dumps(value, protocol=PICKLE_PROTOCOL), loads=pickle.loads
+    ),
+    "json": Codec(
+        id=3,
+        dumps=lambda value: json.dumps(value, separators=(",", ":")).encode("utf-8"),
+        loads=lambda data: json.loads(bytes(data)),
+    ),
+    "msgpack": Codec(id=4, dumps=msgpack_dumps, loads=msgpack_loads),
+}
+CODECS_BY_ID = dict((codec.id, codec) for codec in CODECS.values())
+
+
+def get_codec(name: str) -> Codec:
+    if name not in CODECS:
+        raise ValueError(f"Invalid codec {name}, use one of {list(CODECS)}")
+
+    if name == "msgpack":
+        try:
+            import msgpack  # NOQA
+        except ImportError:
+            raise ValueError("The codec msgpack requires the package msgpack to be installed")
+
+    return CODECS[name]
+
+
+def encode(value: Any, codec: str = "dill") -> bytes:
+    selected_codec = get_codec(codec)
+    return HEADER_MAGIC + bytes([selected_codec.id]) + selected_codec.dumps(value)
+
+
+def decode(data: bytes) -> Any:
+    """
+    Decodes a value using the codec defined on its header.
+    Values without a header were saved by older versions, using dill.
+    """
+    if not data.startswith(HEADER_MAGIC):
+        return dill.loads(data)
+
+    codec_id = data[len(HEADER_MAGIC)]
+    if codec_id not in CODECS_BY_ID:
+        raise ValueError(f"Unknown codec id {codec_id}")
+
+    return CODECS_BY_ID[codec_id].loads(memoryview(data)[HEADER_SIZE:])
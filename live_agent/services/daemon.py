@@ -3,7 +3,7 @@ import sys
 import os
 import time
 import atexit
-from signal import SIGTERM
+from signal import SIGTERM, SIGKILL, SIGHUP
 
 from live_client.utils import logging
 
@@ -21,6 +21,7 @@ class Daemon:
         self.stdout = kwargs.get("stdout", "/dev/null")
         self.stderr = kwargs.get("stderr", "/dev/null")
         self.task_id = kwargs.get("task_id")
+        self.stop_timeout = kwargs.get("stop_timeout", 30)
 
     def daemonize(self):
         """
@@ -114,10 +115,20 @@ class Daemon:
             logging.error(message % self.pidfile)
             return  # not an error in a restart
 
-        # Try killing the daemon process
+        # Ask the daemon process to stop and wait for it, killing its process group on timeout
         try:
+            os.kill(pid, SIGTERM)
+            deadline = time.monotonic() + self.stop_timeout
+            while time.monotonic() < deadline:
+                os.kill(pid, 0)
+                time.sleep(0.1)
+
+            message = "Daemon did not stop after %ss. Killing it\n"
+            sys.stderr.write(message % self.stop_timeout)
+            logging.error(message % self.stop_timeout)
+            os.killpg(os.getpgid(pid), SIGKILL)
             while 1:
-                os.kill(pid, SIGTERM)
+                os.kill(pid, 0)
                 time.sleep(0.1)
         except OSError as err:
             err = str(err)
@@ -128,6 +139,20 @@ class Daemon:
                 print(str(err))
                 sys.exit(1)
 
+    def reload(self):
+        """
+        Ask the daemon to reload its settings
+        """
+        pid = self.loadpid()
+
+        if not pid:
+            message = "pidfile %s does not exist. Daemon not running?\n"
+            sys.stderr.write(message % self.pidfile)
+            logging.error(message % self.pidfile)
+            sys.exit(1)
+
+        os.kill(pid, SIGHUP)
+
     def restart(self):
         """
         Restart the daemon
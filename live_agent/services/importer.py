@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 import importlib
+from typing import Callable, Union
 
 from live_client.utils import logging
 
-__all__ = ["load_enabled_modules"]
+__all__ = ["load_enabled_modules", "load_handler"]
 
 
 def log_and_import(name, package=None):
@@ -30,3 +31,25 @@ def load_process_handlers(settings):
         process_handlers.update(**module.PROCESSES)
 
     return process_handlers
+
+
+def load_handler(handler: Union[str, Callable]) -> Callable:
+    """
+    Resolves a process handler declared as an import path (`"package.module:function"`).
+    Modules can declare their handlers this way on `PROCESSES`, so their dependencies are
+    imported only by the processes which use them.
+    """
+    if not isinstance(handler, str):
+        return handler
+
+    module_name, _, function_name = handler.partition(":")
+    module = importlib.import_module(module_name)
+    return getattr(module, function_name or "start")
+
+
+def list_handler_modules(process_handlers):
+    return [
+        handler.partition(":")[0]
+        for handler in process_handlers.values()
+        if isinstance(handler, str)
+    ]
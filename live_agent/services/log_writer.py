@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import atexit
+import threading
+from collections import deque
+from multiprocessing import util as mp_util
+from typing import Mapping, Any
+
+from eliot import add_destinations
+from eliot.json import EliotJSONEncoder
+
+__all__ = ["BufferedFileDestination", "to_buffered_file"]
+
+WHEN_FULL_POLICIES = ("drop", "block")
+
+
+class BufferedFileDestination:
+    """
+    An eliot destination which writes the messages on a background thread.
+
+    Messages are kept on a bounded buffer and written in batches. When the buffer is full
+    the oldest messages are dropped (`when_full="drop"`) or the logging thread waits for
+    the writer (`when_full="block"`).
+    """
+
+    def __init__(
+        self,
+        file: Any,
+        buffer_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        when_full: str = "block",
+    ):
+        if when_full not in WHEN_FULL_POLICIES:
+            raise ValueError(f"Invalid value for when_full: {when_full}")
+
+        self.fileno = file.fileno()
+        self.file = file
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.when_full = when_full
+
+        self.setup()
+        atexit.register(self.flush)
+        os.register_at_fork(
+            before=self.before_fork,
+            after_in_parent=self.after_fork_in_parent,
+            after_in_child=self.after_fork_in_child,
+        )
+        mp_util.register_after_fork(self, BufferedFileDestination.register_finalizer)
+
+    def setup(self) -> None:
+        self.buffer = deque()
+        self.dropped = 0
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.writer = threading.Thread(target=self.run, name="eliot-writer", daemon=True)
+        self.writer.start()
+
+    def __call__(self, message: Mapping) -> None:
+        with self.condition:
+            if len(self.buffer) >= self.buffer_size:
+                if self.when_full == "drop":
+                    self.buffer.popleft()
+                    self.dropped += 1
+                else:
+                    self.condition.notify_all()
+                    self.condition.wait_for(lambda: len(self.buffer) < self.buffer_size)
+
+            self.buffer.append(message)
+            if len(self.buffer) >= self.batch_size:
+                self.condition.notify_all()
+
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: len(self.buffer) >= self.batch_size, timeout=self.flush_interval
+                )
+
+            self.flush()
+
+    def flush(self) -> None:
+        with self.write_lock:
+            with self.condition:
+                messages = list(self.buffer)
+                self.buffer.clear()
+                dropped, self.dropped = self.dropped, 0
+                self.condition.notify_all()
+
+            if dropped:
+                messages.append(
+                    {"message_type": "warn", "message": f"{dropped} log messages were dropped"}
+                )
+
+            if messages:
+                self.write(messages)
+
+    def write(self, messages: list) -> None:
+        content = b"".join(
+            json.dumps(message, cls=EliotJSONEncoder).encode("utf-8") + b"\n"
+            for message in messages
+        )
+
+        # A single write call, so the lines written by other processes are not mixed with these
+        while content:
+            written = os.write(self.fileno, content)
+            content = content[written:]
+
+    def before_fork(self) -> None:
+        self.write_lock.acquire()
+        self.condition.acquire()
+
+    def after_fork_in_parent(self) -> None:
+        self.condition.release()
+        self.write_lock.release()
+
+    def after_fork_in_child(self) -> None:
+        # The messages on the buffer belong to the parent, the writer thread must be recreated
+        self.setup()
+
+    def register_finalizer(self) -> None:
+        # Processes started by multiprocessing do not run atexit handlers
+        mp_util.Finalize(self, self.flush, exitpriority=100)
+
+
+def to_buffered_file(file: Any, **buffer_settings) -> BufferedFileDestination:
+    destination = BufferedFileDestination(file, **buffer_settings)
+    add_destinations(destination)
+    return destination
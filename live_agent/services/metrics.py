@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+from contextvars import ContextVar
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from multiprocessing import get_context as get_mp_context
+from multiprocessing.sharedctypes import RawArray
+from typing import Mapping, Optional, Union
+
+from live_client.utils import logging
+
+__all__ = ["setup", "assign", "bind", "inc", "set_gauge", "start_server"]
+
+number = Union[int, float]
+
+METRICS_PREFIX = "live_agent"
+METRICS = {
+    "events_received_total": ("counter", "Events received by the process"),
+    "events_emitted_total": ("counter", "Events sent by the process"),
+    "queue_depth": ("gauge", "Items waiting on the queues of the process"),
+    "state_saves_total": ("counter", "Number of times the state was saved"),
+    "state_save_seconds_total": ("counter", "Time spent saving the state"),
+    "state_bytes_written_total": ("counter", "Bytes written when saving the state"),
+    "restarts_total": ("counter", "Number of times the process was restarted"),
+    "replay_lag_seconds": ("gauge", "How far behind schedule the replay is"),
+}
+METRIC_INDEXES = dict((name, index) for index, name in enumerate(METRICS))
+OTHERS_SLOT = 0
+NUM_LOCKS = 16
+
+# Created by the supervisor before forking, shared by all processes
+registry = None
+
+# The slot updated by the current process (or async task)
+process_slot = OTHERS_SLOT
+current_slot: ContextVar = ContextVar("metrics_slot", default=None)
+
+
+class MetricsRegistry:
+    """
+    A table of metrics for each process, stored on shared memory.
+    Slots are assigned by the supervisor, which is also the one rendering the metrics.
+    """
+
+    def __init__(self, max_processes: int = 256):
+        mp = get_mp_context("fork")
+        self.max_processes = max_processes
+        self.values = RawArray("d", max_processes * len(METRICS))
+        self.locks = [mp.Lock() for _ in range(NUM_LOCKS)]
+        self.slots = {"others": OTHERS_SLOT}
+
+    def assign(self, name: str) -> int:
+        if name not in self.slots:
+            if len(self.slots) < self.max_processes:
+                self.slots[name] = len(self.slots)
+            else:
+                logging.warn(f"No metrics slots left for {name}")
+                return OTHERS_SLOT
+
+        return self.slots[name]
+
+    def add(self, slot: int, metric: str, amount: number) -> None:
+        index = slot * len(METRICS) + METRIC_INDEXES[metric]
+        with self.locks[slot % NUM_LOCKS]:
+            self.values[index] += amount
+
+    def set(self, slot: int, metric: str, value: number) -> None:
+        index = slot * len(METRICS) + METRIC_INDEXES[metric]
+        self.values[index] = value
+
+    def render(self) -> str:
+        lines = []
+        for metric, (metric_type, description) in METRICS.items():
+            metric_name = f"{METRICS_PREFIX}_{metric}"
+            lines.append(f"# HELP {metric_name} {description}")
+            lines.append(f"# TYPE {metric_name} {metric_type}")
+
+            for name, slot in self.slots.items():
+                value = self.values[slot * len(METRICS) + METRIC_INDEXES[metric]]
+                label = name.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(f'{metric_name}{{process="{label}"}} {value:g}')
+
+        return "\n".join(lines) + "\n"
+
+
+def setup(metrics_settings: Mapping) -> Optional[MetricsRegistry]:
+    global registry
+
+    if metrics_settings.get("enabled", False):
+        registry = MetricsRegistry(max_processes=metrics_settings.get("max_processes", 256))
+
+    return registry
+
+
+def assign(name: str) -> None:
+    if registry is not None:
+        registry.assign(name)
+
+
+def bind(name: str, process_wide: bool = True) -> None:
+    """
+    Makes the metrics updated by the current process (or async task) refer to `name`.
+    Processes without a slot of their own, like the chatbot's room bots,
+    keep updating the slot of the process which started them.
+    """
+    global process_slot
+
+    if (registry is not None) and (name in registry.slots):
+        if process_wide:
+            process_slot = registry.slots[name]
+        else:
+            current_slot.set(registry.slots[name])
+
+
+def get_slot(name: Optional[str] = None) -> int:
+    if name is not None:
+        return registry.slots.get(name, OTHERS_SLOT)
+
+    slot = current_slot.get()
+    if slot is None:
+        slot = process_slot
+
+    return slot
+
+
+def inc(metric: str, amount: number = 1, name: Optional[str] = None) -> None:
+    if registry is not None:
+        registry.add(get_slot(name), metric, amount)
+
+
+def set_gauge(metric: str, value: number, name: Optional[str] = None) -> None:
+    if registry is not None:
+        registry.set(get_slot(name), metric, value)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    timeout = 5
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+
+        content = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+def start_server(metrics_settings: Mapping) -> Optional[ThreadingHTTPServer]:
+    """
+    Starts the http server for the metrics on a daemon thread, so slow clients do not block
+    the caller. The caller should call `shutdown` and `server_close` when finished.
+    """
+    if registry is None:
+        return None
+
+    address = (metrics_settings.get("host", "127.0.0.1"), metrics_settings.get("port", 9108))
+    try:
+        server = ThreadingHTTPServer(address, MetricsRequestHandler)
+    except OSError as e:
+        logging.error(f"Cannot expose the metrics on {address}: {e}")
+        return None
+
+    server.daemon_threads = True
+    os.register_at_fork(after_in_child=server.socket.close)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logging.info("Metrics available at http://{}:{}/metrics".format(*address))
+    return server
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+import numpy as np
+
+from .window import EventWindow, build_snapshot
+
+__all__ = ["ColumnarWindow"]
+
+INITIAL_CAPACITY = 1024
+
+
+def to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class ColumnarWindow(EventWindow):
+    """
+    An `EventWindow` which stores the values of each mnemonic on a numpy array,
+    with vectorized statistics over the window (or over its last `duration` seconds).
+
+    `mnemonics` maps names to the curves on the events, like the key `mnemonics`
+    from the monitor settings. The values and statistics are accessed by name:
+
+      window.mean("rop"), window.slope("rop", duration=30), window.uom("rop")
+    """
+
+    def __init__(
+        self,
+        mnemonics: Mapping[str, str],
+        index_mnemonic: str = "timestamp",
+        window_duration: float = 60,
+        items: Optional[Iterable[Mapping]] = None,
+        capacity: int = INITIAL_CAPACITY,
+        allowed_lateness: float = 0,
+        reset_threshold: Optional[float] = None,
+    ):
+        self.mnemonics = dict(
+            (name, curve) for name, curve in mnemonics.items() if curve != index_mnemonic
+        )
+        self.head = 0
+        self.tail = 0
+        self.index_values = np.empty(capacity, dtype=np.float64)
+        self.columns = dict((name, np.empty(capacity, dtype=np.float64)) for name in self.mnemonics)
+        self.units: Dict[str, Optional[str]] = dict((name, None) for name in self.mnemonics)
+
+        super().__init__(
+            index_mnemonic=index_mnemonic,
+            window_duration=window_duration,
+            items=items,
+            allowed_lateness=allowed_lateness,
+            reset_threshold=reset_threshold,
+        )
+
+    @property
+    def capacity(self) -> int:
+        return len(self.index_values)
+
+    def reserve(self) -> None:
+        """
+        Makes room for one more item, moving the items to the start of the arrays
+        (or growing the arrays when more than half of them is in use)
+        """
+        size = self.tail - self.head
+        grow = size * 2 > self.capacity
+        new_capacity = self.capacity * 2
+
+        for name, column in [(None, self.index_values)] + list(self.columns.items()):
+            if grow:
+                new_column = np.empty(new_capacity, dtype=np.float64)
+            else:
+                new_column = column
+
+            new_column[:size] = column[self.head : self.tail]
+            if name is None:
+                self.index_values = new_column
+            else:
+                self.columns[name] = new_column
+
+        self.head = 0
+        self.tail = size
+
+    def push(self, event: Mapping, index: Any) -> None:
+        if self.tail == self.capacity:
+            self.reserve()
+
+        self.store(self.tail, event, index)
+        self.tail += 1
+
+    def insert(self, event: Mapping, index: Any) -> None:
+        if self.tail == self.capacity:
+            self.reserve()
+
+        # Late events are close to the end, so only a few items are shifted
+        position = self.head + self.bisect(index)
+        for column in [self.index_values] + list(self.columns.values()):
+            column[position + 1 : self.tail + 1] = column[position : self.tail]
+
+        self.store(position, event, index)
+        self.tail += 1
+
+    def bisect(self, index: Any) -> int:
+        return int(np.searchsorted(self.indexes, index, side="right"))
+
+    def store(self, position: int, event: Mapping, index: Any) -> None:
+        self.index_values[position] = index
+        for name, curve in self.mnemonics.items():
+            self.columns[name][position] = to_float(event.get(curve))
+            uom = event.get(f"{curve}_uom")
+            if uom is not None:
+                self.units[name] = uom
+
+    def evict(self) -> List[Mapping]:
+        indexes = self.index_values[self.head : self.tail]
+        new_head = self.head + int(np.searchsorted(indexes, self.start, side="left"))
+        evicted_items = [self.build_item(position) for position in range(self.head, new_head)]
+        self.head = new_head
+        return evicted_items
+
+    def clear(self) -> List[Mapping]:
+        removed_items = list(self)
+        self.head = 0
+        self.tail = 0
+        self.last_index = None
+        return removed_items
+
+    def snapshot(self) -> Dict[str, Any]:
+        columns = {self.index_mnemonic: self.indexes.tolist()}
+        for name, curve in self.mnemonics.items():
+            columns[curve] = self.values(name).tolist()
+            columns[f"{curve}_uom"] = [self.units[name]] * len(self)
+
+        return build_snapshot(self.index_mnemonic, len(self), columns)
+
+    def __len__(self) -> int:
+        return self.tail - self.head
+
+    def __iter__(self):
+        for position in range(self.head, self.tail):
+            yield self.build_item(position)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.build_item(self.head + item) for item in range(*key.indices(len(self)))]
+
+        if key < 0:
+            key += len(self)
+        if not (0 <= key < len(self)):
+            raise IndexError("window index out of range")
+
+        return self.build_item(self.head + key)
+
+    def build_item(self, position: int) -> Dict[str, Any]:
+        """
+        Rebuilds an item as received on the events, for compatibility with the other windows
+        """
+        item = {self.index_mnemonic: self.index_values[position].item()}
+        for name, curve in self.mnemonics.items():
+            item[curve] = self.columns[name][position].item()
+            item[f"{curve}_uom"] = self.units[name]
+
+        return item
+
+    ##
+    # Columnar access
+    @property
+    def indexes(self) -> np.ndarray:
+        return self.index_values[self.head : self.tail]
+
+    def values(self, name: str, duration: Optional[float] = None) -> np.ndarray:
+        """
+        The values for the mnemonic `name`, optionally only for the last `duration` seconds.
+        Returns a view, which is only valid until the window is updated.
+        """
+        start = self.head
+        if duration is not None:
+            start += int(np.searchsorted(self.indexes, self.end - duration, side="left"))
+
+        return self.columns[name][start : self.tail]
+
+    def uom(self, name: str) -> Optional[str]:
+        return self.units.get(name)
+
+    def min(self, name: str, duration: Optional[float] = None) -> float:
+        values = self.values(name, duration)
+        return np.nanmin(values) if values.size else np.nan
+
+    def max(self, name: str, duration: Optional[float] = None) -> float:
+        values = self.values(name, duration)
+        return np.nanmax(values) if values.size else np.nan
+
+    def mean(self, name: str, duration: Optional[float] = None) -> float:
+        values = self.values(name, duration)
+        return np.nanmean(values) if values.size else np.nan
+
+    def std(self, name: str, duration: Optional[float] = None) -> float:
+        values = self.values(name, duration)
+        return np.nanstd(values) if values.size else np.nan
+
+    def slope(self, name: str, duration: Optional[float] = None) -> float:
+        """
+        The slope of the least squares line fitting the values, in units per second
+        """
+        values = self.values(name, duration)
+        index = self.indexes[len(self) - len(values) :]
+        is_valid = ~np.isnan(values)
+        if np.count_nonzero(is_valid) < 2:
+            return np.nan
+
+        x = index[is_valid] - index[is_valid].mean()
+        y = values[is_valid]
+        denominator = np.dot(x, x)
+        if denominator == 0:
+            return np.nan
+
+        return np.dot(x, y - y.mean()) / denominator
+
+    def derivative(self, name: str, duration: Optional[float] = None) -> np.ndarray:
+        """
+        The rate of change of the values (per second) at each item
+        """
+        values = self.values(name, duration)
+        index = self.indexes[len(self) - len(values) :]
+        if values.size < 2:
+            return np.full(values.size, np.nan)
+
+        return np.gradient(values, index)
@@ -1,8 +1,28 @@
 # -*- coding: utf-8 -*-
 
+import time
+
 from live_client.utils import logging
 
-__all__ = ["prepare_query", "handle_events"]
+from live_agent.services import metrics
+from .window import EventWindow
+
+__all__ = ["prepare_query", "handle_events", "delta_callback"]
+
+# The expressions used to aggregate the values of a mnemonic on the query
+AGGREGATION_FUNCTIONS = {
+    "lastv": "lastv(value:object)",
+    "avg": "avg(value:number)",
+    "min": "min(value:number)",
+    "max": "max(value:number)",
+    "count": "count()",
+}
+
+# The function used for the index, which must keep increasing for the window
+INDEX_AGGREGATION = "max"
+
+# The key used to store the window on the state of the monitor
+WINDOW_STATE_NAME = "window"
 
 
 def prepare_query(settings):
@@ -10,9 +30,71 @@ def prepare_query(settings):
     mnemonics_settings = settings.get("monitor", {}).get("mnemonics", {})
     query_mnemonics = list(mnemonics_settings.values())
 
+    return build_query(event_type, query_mnemonics, aggregation=build_aggregation(settings))
+
+
+def build_aggregation(settings):
+    """
+    Reads the key `aggregation` from the monitor settings, with the function applied to the
+    mnemonics (or to some of them, using `functions`) over the last `over` seconds,
+    every `every` seconds. Returns `None` when no aggregation is configured.
+    The index mnemonic is always aggregated using `INDEX_AGGREGATION`.
+    """
+    monitor_settings = settings.get("monitor", {})
+    aggregation_settings = monitor_settings.get("aggregation")
+    if not aggregation_settings:
+        return None
+
+    mnemonics_settings = monitor_settings.get("mnemonics", {})
+    over = aggregation_settings.get("over", 1)
+    aggregation = {
+        "function": aggregation_settings.get("function", "lastv"),
+        "over": over,
+        "every": aggregation_settings.get("every", over),
+        "functions": dict(
+            (mnemonics_settings.get(name, name), function)
+            for name, function in aggregation_settings.get("functions", {}).items()
+        ),
+    }
+
+    for function in [aggregation["function"]] + list(aggregation["functions"].values()):
+        if function not in AGGREGATION_FUNCTIONS:
+            valid_functions = ", ".join(AGGREGATION_FUNCTIONS)
+            raise ValueError(
+                f"Invalid aggregation {function}, valid options are: {valid_functions}"
+            )
+
+    index_mnemonic = mnemonics_settings.get("index", "timestamp")
+    if aggregation["functions"].get(index_mnemonic, INDEX_AGGREGATION) != INDEX_AGGREGATION:
+        logging.warn(f"Ignoring the aggregation for {index_mnemonic}, used as index")
+    aggregation["functions"][index_mnemonic] = INDEX_AGGREGATION
+
+    return aggregation
+
+
+def format_interval(seconds):
+    if seconds == 1:
+        return "second"
+
+    return f"{seconds} seconds"
+
+
+def build_query(event_type, query_mnemonics, filter_mnemonic=True, aggregation=None):
+    """
+    Builds a query for the latest value of each mnemonic, every second, or for the aggregation
+    built by `build_aggregation`.
+    Only rows containing the first mnemonic are returned, unless `filter_mnemonic` is false.
+    """
+    if aggregation is None:
+        aggregation = {"function": "lastv", "over": 1, "every": 1}
+
+    functions = aggregation.get("functions", {})
     mnemonics_list = "|".join(query_mnemonics)
     values_pipe_fragments = [
-        r"lastv(value:object):if(\mnemonic:{0}) as {0}".format(item) for item in query_mnemonics
+        r"{1}:if(\mnemonic:{0}) as {0}".format(
+            item, AGGREGATION_FUNCTIONS[functions.get(item, aggregation["function"])]
+        )
+        for item in query_mnemonics
     ]
     units_pipe_fragments = [
         r"lastv(uom:object):if(\mnemonic:{0}) as {0}_uom".format(item) for item in query_mnemonics
@@ -20,47 +102,163 @@ def prepare_query(settings):
     pipe_fragments = values_pipe_fragments + units_pipe_fragments
     mnemonics_pipe = ", ".join(pipe_fragments)
 
+    if filter_mnemonic:
+        filter_pipe = "=> @filter({} != null)".format(query_mnemonics[0])
+    else:
+        filter_pipe = ""
+
     query = """
         {} mnemonic!:({}) .flags:nocount
-        => {} over last second every second
-        => @filter({} != null)
+        => {} over last {} every {}
+        {}
     """.format(
-        event_type, mnemonics_list, mnemonics_pipe, query_mnemonics[0]
+        event_type,
+        mnemonics_list,
+        mnemonics_pipe,
+        format_interval(aggregation["over"]),
+        format_interval(aggregation["every"]),
+        filter_pipe,
     )
     logging.debug(f'query is "{query}"')
 
     return query
 
 
-def handle_events(event, callback, settings, accumulator=None):
+def build_window(settings, items=None):
     monitor_settings = settings.get("monitor", {})
     window_duration = monitor_settings.get("window_duration", 60)
     mnemonics = monitor_settings.get("mnemonics", {})
     index_mnemonic = mnemonics.get("index", "timestamp")
+    window_type = monitor_settings.get("window_type", "events")
+    lateness_settings = dict(
+        allowed_lateness=monitor_settings.get("allowed_lateness", 0),
+        reset_threshold=monitor_settings.get("reset_threshold"),
+    )
+
+    if window_type == "columnar":
+        from .columnar import ColumnarWindow
 
-    if accumulator is None:
-        accumulator = []
+        return ColumnarWindow(
+            mnemonics,
+            index_mnemonic=index_mnemonic,
+            window_duration=window_duration,
+            items=items,
+            **lateness_settings,
+        )
+
+    return EventWindow(
+        index_mnemonic=index_mnemonic,
+        window_duration=window_duration,
+        items=items,
+        **lateness_settings,
+    )
 
+
+def delta_callback(f):
+    """
+    Marks a callback for `handle_events` as receiving only the changes to the window.
+    It is called as `f(added_items, removed_items, window)`, so running aggregates can be
+    updated without scanning the whole window. Eg:
+
+      @delta_callback
+      def update_average(added_items, removed_items, window):
+          ...
+    """
+    f.receives_delta = True
+    return f
+
+
+def handle_events(event, callback, settings, accumulator=None, state_manager=None):
+    """
+    Adds the valid items of `event` to the window of the monitor and calls `callback` with it
+    (or with the changes to it, when the callback is decorated with `delta_callback`).
+    Returns the window, which should be used as `accumulator` for the next event.
+    When `accumulator` is a list it is also updated in place, for callers which ignore the result.
+
+    With a `state_manager`, the window is saved every `checkpoint_interval` seconds
+    and restored when the monitor starts.
+    """
+    caller_items = accumulator if isinstance(accumulator, list) else None
+    if not isinstance(accumulator, EventWindow):
+        should_restore = (state_manager is not None) and (accumulator is None)
+        accumulator = build_window(settings, items=accumulator)
+        if should_restore:
+            restore_window(accumulator, callback, state_manager)
+
+    metrics.inc("events_received_total")
     try:
         latest_data, missing_curves = validate_event(event, settings)
 
         if latest_data:
-            accumulator, start, end = refresh_accumulator(
-                latest_data, accumulator, index_mnemonic, window_duration
-            )
+            added_items, removed_items = accumulator.extend(latest_data)
+            logging.debug(f"{accumulator!r}")
+            if caller_items is not None:
+                caller_items[:] = accumulator
 
-            if accumulator:
+            if getattr(callback, "receives_delta", False):
+                if added_items or removed_items:
+                    callback(added_items, removed_items, accumulator)
+            elif accumulator:
                 callback(accumulator)
 
+            if state_manager is not None:
+                checkpoint_window(accumulator, settings, state_manager)
+
         elif missing_curves:
             missing_curve_names = ", ".join(missing_curves)
             logging.info(f"Some curves are missing ({missing_curve_names}) from event {event} ")
 
     except Exception as e:
         logging.exception(f"Error during query: <{e}>")
-        handle_events(event, callback, settings)
+        return handle_events(event, callback, settings)
+
+    return accumulator
+
+
+def get_window_state_manager(window, state_manager):
+    """
+    The window is saved apart from the state of the monitor, which is never overwritten by it
+    """
+    window_state_manager = getattr(window, "state_manager", None)
+    if window_state_manager is None:
+        window_state_manager = state_manager.derive(WINDOW_STATE_NAME)
+        window.state_manager = window_state_manager
+
+    return window_state_manager
+
+
+def restore_window(window, callback, state_manager):
+    window_state_manager = get_window_state_manager(window, state_manager)
+    snapshot = window_state_manager.load()
+    if not snapshot.get("index_mnemonic"):
         return
 
+    try:
+        window.restore(snapshot)
+    except Exception as e:
+        logging.warn(f"Error restoring the window: {e}")
+        window.clear()
+        return
+
+    logging.info(f"Window restored with {len(window)} events")
+    if window and getattr(callback, "receives_delta", False):
+        callback(list(window), [], window)
+
+
+def checkpoint_window(window, settings, state_manager):
+    """
+    Saves a snapshot of the window, at most once every `checkpoint_interval` seconds
+    """
+    checkpoint_interval = settings.get("monitor", {}).get("checkpoint_interval", 60)
+    now = time.monotonic()
+    checkpointed_at = getattr(window, "checkpointed_at", None)
+    if (checkpointed_at is not None) and (now - checkpointed_at < checkpoint_interval):
+        return
+
+    window.checkpointed_at = now
+    window_state_manager = get_window_state_manager(window, state_manager)
+    window_state_manager.save(window.snapshot(), force=True)
+
 
 def validate_event(event, settings):
     valid_events = []
@@ -87,36 +285,14 @@ def validate_event(event, settings):
 
 
 def refresh_accumulator(latest_events, accumulator, index_mnemonic, window_duration):
-    # Purge old events and add the new ones
-    latest_event = latest_events[-1]
-    window_end = latest_event.get(index_mnemonic, 0)
-    window_start = window_end - window_duration
-    last_index = window_start
-
-    if index_mnemonic not in latest_event:
-        mnemonics_list = latest_event.keys()
-        logging.error(
-            f"Mnemonic '{index_mnemonic}' not found. Available mnemonics are: '{mnemonics_list}'"
-        )
-
-    accumulator.extend(latest_events)
-    purged_accumulator = []
-    for item in accumulator:
-        index = item.get(index_mnemonic, 0)
-        if (window_start <= index <= window_end) and (index >= last_index):
-            purged_accumulator.append(item)
-            last_index = index
-        elif index < last_index:
-            # Reset the accumulator
-            purged_accumulator = [item]
-            last_index = index
-        elif index == 0:
-            logging.error(f"{index_mnemonic} not found, ignoring event")
-
-    logging.debug(
-        "{} of {} events between {} and {}".format(
-            len(purged_accumulator), len(accumulator), window_start, window_end
-        )
+    """
+    Purges old events and adds the new ones. Kept for compatibility, prefer using `EventWindow`
+    """
+    window = EventWindow(
+        index_mnemonic=index_mnemonic, window_duration=window_duration, items=accumulator
     )
+    window.extend(latest_events)
+    if isinstance(accumulator, list):
+        accumulator[:] = window
 
-    return purged_accumulator, window_start, window_end
+    return list(window), window.start, window.end
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+from bisect import bisect_left, bisect_right
+from collections import deque
+from collections.abc import Sequence
+from itertools import chain
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from live_client.utils import logging
+
+__all__ = ["EventWindow"]
+
+
+class EventWindow(Sequence):
+    """
+    The events received during the last `window_duration` (measured using `index_mnemonic`).
+
+    New events are appended to the right and old ones are evicted from the left, so each event
+    costs amortized O(1). An event whose index is lower than the last one (like when a new run
+    starts) resets the window.
+
+    With `allowed_lateness`, events up to that many seconds older than the last one are
+    inserted in order instead, and only larger regressions reset the window. With
+    `reset_threshold`, regressions smaller than it are ignored as too late.
+    The events newer than `allowed_lateness` are kept on a sorted buffer (where the late events
+    are inserted, after a binary search) and moved to the deque as newer events arrive, so
+    the cost of each insertion depends on the number of events in the buffer, not in the window.
+    """
+
+    def __init__(
+        self,
+        index_mnemonic: str = "timestamp",
+        window_duration: float = 60,
+        items: Optional[Iterable[Mapping]] = None,
+        allowed_lateness: float = 0,
+        reset_threshold: Optional[float] = None,
+    ):
+        self.index_mnemonic = index_mnemonic
+        self.window_duration = window_duration
+        self.allowed_lateness = allowed_lateness
+        self.reset_threshold = reset_threshold
+        self.items: deque = deque()
+        self.recent_items: List[Mapping] = []
+        self.recent_indexes: List[Any] = []
+        self.last_index = None
+
+        if items:
+            self.extend(items)
+
+    @property
+    def end(self) -> float:
+        return self.last_index or 0
+
+    @property
+    def start(self) -> float:
+        return self.end - self.window_duration
+
+    def get_index(self, event: Mapping) -> Any:
+        return event.get(self.index_mnemonic)
+
+    def append(self, event: Mapping) -> Optional[List[Mapping]]:
+        """
+        Adds an event to the window, returning the items removed by a reset (if any).
+        Events without an index and late events which were not added are ignored, returning `None`.
+        """
+        index = self.get_index(event)
+        if index is None:
+            mnemonics_list = list(event.keys())
+            logging.error(
+                f"Mnemonic '{self.index_mnemonic}' not found, ignoring event. "
+                f"Available mnemonics are: '{mnemonics_list}'"
+            )
+            return None
+
+        removed_items = []
+        if (self.last_index is not None) and (index < self.last_index):
+            lateness = self.last_index - index
+            if lateness <= self.allowed_lateness:
+                if index < self.start:
+                    return None
+
+                self.insert(event, index)
+                return removed_items
+
+            if (self.reset_threshold is not None) and (lateness < self.reset_threshold):
+                logging.debug(f"Ignoring event with index {index}, {lateness} behind the window")
+                return None
+
+            logging.debug(f"Index went from {self.last_index} to {index}, resetting the window")
+            removed_items = self.clear()
+
+        self.push(event, index)
+        self.last_index = index
+        return removed_items
+
+    def push(self, event: Mapping, index: Any) -> None:
+        """
+        Adds an event after the last one
+        """
+        if not self.allowed_lateness:
+            self.items.append(event)
+            return
+
+        self.recent_items.append(event)
+        self.recent_indexes.append(index)
+
+        # Late events cannot be older than this anymore, so these items are settled
+        watermark = index - self.allowed_lateness
+        settled_count = bisect_left(self.recent_indexes, watermark)
+        if settled_count:
+            self.items.extend(self.recent_items[:settled_count])
+            del self.recent_items[:settled_count]
+            del self.recent_indexes[:settled_count]
+
+    def insert(self, event: Mapping, index: Any) -> None:
+        """
+        Adds a late event after the items with an index lower than or equal to its own
+        """
+        position = bisect_right(self.recent_indexes, index)
+        self.recent_items.insert(position, event)
+        self.recent_indexes.insert(position, index)
+
+    def extend(self, events: Iterable[Mapping]) -> Tuple[List[Mapping], List[Mapping]]:
+        """
+        Adds the events and evicts the ones which are now outside the window.
+        Returns the events added and the items removed (which may include some of the events
+        just added, when the window was reset).
+        """
+        added_items: List[Mapping] = []
+        removed_items: List[Mapping] = []
+        for event in events:
+            items_removed_by_reset = self.append(event)
+            if items_removed_by_reset is not None:
+                added_items.append(event)
+                removed_items.extend(items_removed_by_reset)
+
+        removed_items.extend(self.evict())
+        return added_items, removed_items
+
+    def evict(self) -> List[Mapping]:
+        window_start = self.start
+        items = self.items
+        evicted_items = []
+        while items and (self.get_index(items[0]) < window_start):
+            evicted_items.append(items.popleft())
+
+        # When the window is shorter than `allowed_lateness`
+        if not items:
+            evicted_count = bisect_left(self.recent_indexes, window_start)
+            if evicted_count:
+                evicted_items.extend(self.recent_items[:evicted_count])
+                del self.recent_items[:evicted_count]
+                del self.recent_indexes[:evicted_count]
+
+        return evicted_items
+
+    def clear(self) -> List[Mapping]:
+        removed_items = list(self)
+        self.items.clear()
+        self.recent_items.clear()
+        self.recent_indexes.clear()
+        self.last_index = None
+        return removed_items
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        The items on the window in a compact columnar form, which can be serialized
+        and loaded using `restore`. Values repeated on every item (like units) are stored once.
+        """
+        items = list(self)
+        keys: Dict[str, None] = {}
+        for item in items:
+            keys.update(dict.fromkeys(item))
+
+        return build_snapshot(
+            self.index_mnemonic,
+            len(items),
+            dict((key, [item.get(key) for item in items]) for key in keys),
+        )
+
+    def restore(self, snapshot: Mapping[str, Any]) -> None:
+        """
+        Adds the items from a snapshot, discarding the ones older than the window
+        """
+        if snapshot.get("index_mnemonic") != self.index_mnemonic:
+            logging.warn(f"Ignoring a snapshot indexed by {snapshot.get('index_mnemonic')}")
+            return
+
+        columns = snapshot.get("columns", {})
+        constants = snapshot.get("constants", {})
+        rows = zip(*columns.values()) if columns else ((),) * snapshot.get("size", 0)
+        self.extend(dict(constants, **dict(zip(columns, row))) for row in rows)
+
+    def __len__(self) -> int:
+        return len(self.items) + len(self.recent_items)
+
+    def __iter__(self):
+        return chain(self.items, self.recent_items)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return list(self)[key]
+
+        if key < 0:
+            key += len(self)
+        if not (0 <= key < len(self)):
+            raise IndexError("window index out of range")
+
+        settled_count = len(self.items)
+        if key < settled_count:
+            return self.items[key]
+
+        return self.recent_items[key - settled_count]
+
+    def __repr__(self) -> str:
+        return f"<EventWindow {len(self)} events between {self.start} and {self.end}>"
+
+
+def build_snapshot(index_mnemonic: str, size: int, columns: Mapping[str, list]) -> Dict[str, Any]:
+    snapshot: Dict[str, Any] = {
+        "index_mnemonic": index_mnemonic,
+        "size": size,
+        "columns": {},
+        "constants": {},
+    }
+    for key, values in columns.items():
+        if values and (key != index_mnemonic) and (values.count(values[0]) == len(values)):
+            snapshot["constants"][key] = values[0]
+        else:
+            snapshot["columns"][key] = values
+
+    return snapshot
@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import queue
+import socket
+import tempfile
+import threading
+from multiprocessing.connection import Listener, Client, Connection
+from time import monotonic, sleep
+from typing import Any, Dict, List, Mapping, Optional
+
+from setproctitle import setproctitle
+from live_client.utils import logging
+
+from .monitors.utils.query import build_aggregation, build_query, prepare_query
+
+__all__ = ["setup", "start", "on_event"]
+
+PROCESS_NAME = "query-multiplexer"
+CONNECT_TIMEOUT = 10
+RESTART_DELAY = 1
+# Seconds a subscriber waits for events before giving up, unless another timeout is given
+DEFAULT_TIMEOUT = 120
+EVENT_TYPE_EVENT = "event"
+EVENT_TYPE_DESTROY = "destroy"
+
+# Defined by the supervisor before forking, using the key `multiplexer` from the settings
+address = None
+authkey = None
+max_pending = 1000
+
+
+def setup(multiplexer_settings: Mapping) -> bool:
+    global address, authkey, max_pending
+
+    if not multiplexer_settings.get("enabled", False):
+        return False
+
+    default_address = os.path.join(tempfile.gettempdir(), f"live-agent-{os.getpid()}.mux")
+    address = multiplexer_settings.get("address", default_address)
+    authkey = os.urandom(16)
+    max_pending = multiplexer_settings.get("max_pending", max_pending)
+    return True
+
+
+def build_subscription(settings: Mapping) -> Dict[str, Any]:
+    mnemonics_settings = settings.get("monitor", {}).get("mnemonics", {})
+    aggregation = build_aggregation(settings)
+
+    # Only monitors with the same aggregation share a query
+    shape = {}
+    if aggregation is not None:
+        shape["aggregation"] = aggregation
+
+    return {
+        "event_type": settings.get("event_type"),
+        "mnemonics": list(mnemonics_settings.values()),
+        "shape": shape,
+    }
+
+
+##
+# Hub
+class Subscriber:
+    """
+    A monitor connected to the multiplexer. The events are sent by a thread of its own,
+    so a slow subscriber does not delay the others. Up to `max_pending` events wait to be sent.
+    """
+
+    def __init__(self, connection: Connection, mnemonics: List[str]):
+        self.connection = connection
+        self.mnemonics = mnemonics
+        self.is_connected = True
+        self.messages: queue.Queue = queue.Queue(maxsize=max_pending)
+        self.sender = threading.Thread(target=self.run_sender, daemon=True)
+        self.sender.start()
+
+    def project(self, rows: List[Mapping], foreign_curves: set) -> List[Mapping]:
+        """
+        Removes the curves requested only by other subscribers, and the rows without
+        this subscriber's first mnemonic (as the query built by `prepare_query` would)
+        """
+        required_curve = self.mnemonics[0]
+        return [
+            dict(
+                (key, value)
+                for key, value in row.items()
+                if key not in foreign_curves and key.rpartition("_uom")[0] not in foreign_curves
+            )
+            for row in rows
+            if row.get(required_curve) is not None
+        ]
+
+    def offer(self, message: Mapping) -> bool:
+        """
+        Queues a message for the subscriber, returns `False` when it is too far behind
+        """
+        try:
+            self.messages.put_nowait(message)
+        except queue.Full:
+            return False
+
+        return True
+
+    def run_sender(self) -> None:
+        while True:
+            message = self.messages.get()
+            if message is None:
+                return
+
+            try:
+                self.connection.send(message)
+            except (OSError, ValueError):
+                self.disconnect()
+                return
+
+    def disconnect(self) -> None:
+        """
+        Shuts the connection down (so the subscriber and the thread serving it see it has ended)
+        and stops the sender
+        """
+        if not self.is_connected:
+            return
+
+        self.is_connected = False
+        try:
+            # Closing the connection would not wake up the thread waiting on it
+            with socket.fromfd(
+                self.connection.fileno(), socket.AF_UNIX, socket.SOCK_STREAM
+            ) as sock:
+                sock.shutdown(socket.SHUT_RDWR)
+        except (OSError, ValueError):
+            pass
+
+        # Discards the pending messages, waking up the sender with `None`
+        with self.messages.mutex:
+            self.messages.queue.clear()
+            self.messages.queue.append(None)
+            self.messages.not_empty.notify()
+
+
+class Stream:
+    """
+    A query to live, shared by the subscribers of the same event type and shape (like the
+    same aggregation), which requests the union of the mnemonics requested by them.
+    `lock` protects the subscribers and is only held briefly, `restart_lock` is held while
+    the query is (re)started, which only delays the subscribers of this stream.
+    """
+
+    def __init__(self, event_type: str, shape: Mapping, settings: Mapping):
+        self.event_type = event_type
+        self.shape = shape
+        self.settings = settings
+        self.subscribers: List[Subscriber] = []
+        self.mnemonics: List[str] = []
+        self.process = None
+        self.results_queue = None
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.restart_lock = threading.Lock()
+
+    def add(self, subscriber: Subscriber) -> None:
+        with self.lock:
+            self.subscribers.append(subscriber)
+
+    def remove(self, subscriber: Subscriber) -> bool:
+        """
+        Removes a subscriber, returns `True` when there are no subscribers left
+        """
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+            return not self.subscribers
+
+    def update_query(self) -> None:
+        """
+        Starts the query again only when a subscriber requests mnemonics which are not on it,
+        the mnemonics of the subscribers which left are kept while the stream is used.
+        Stops the query when there are no subscribers left.
+        """
+        with self.restart_lock:
+            with self.lock:
+                has_subscribers = bool(self.subscribers)
+                mnemonics = list(self.mnemonics)
+                for subscriber in self.subscribers:
+                    mnemonics.extend(item for item in subscriber.mnemonics if item not in mnemonics)
+
+            if not has_subscribers:
+                self.stop()
+            elif (len(mnemonics) != len(self.mnemonics)) or (self.process is None):
+                self.restart(mnemonics)
+
+    def restart(self, mnemonics: List[str]) -> None:
+        # Imported here to keep the supervisor lighter
+        from live_client import query as live_query
+
+        self.stop()
+        with self.lock:
+            self.mnemonics = mnemonics
+
+        statement = build_query(self.event_type, mnemonics, filter_mnemonic=False, **self.shape)
+        logging.info(f"Starting the query for {self.event_type} ({len(mnemonics)} mnemonics)")
+
+        try:
+            self.process, self.results_queue = live_query.run(
+                statement, self.settings, realtime=True
+            )
+        except Exception as e:
+            # Retried when the next subscriber arrives, the current ones time out without events
+            logging.exception(f"Error starting the query for {self.event_type}: {e}")
+            return
+
+        self.generation += 1
+        forwarder = threading.Thread(
+            target=self.forward, args=(self.generation, self.results_queue), daemon=True
+        )
+        forwarder.start()
+
+    def stop(self) -> None:
+        self.generation += 1
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.results_queue.close()
+
+        self.process = None
+        self.results_queue = None
+
+    def forward(self, generation: int, results_queue: Any) -> None:
+        while generation == self.generation:
+            try:
+                event = results_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError, ValueError):
+                break
+
+            event_type = event.get("data", {}).get("type")
+            if event_type == EVENT_TYPE_EVENT:
+                self.fan_out(event)
+            elif event_type == EVENT_TYPE_DESTROY:
+                break
+
+        if generation != self.generation:
+            return
+
+        logging.warn(f"The query for {self.event_type} has ended, restarting it")
+        sleep(RESTART_DELAY)
+        with self.restart_lock:
+            if (generation == self.generation) and self.subscribers:
+                self.restart(self.mnemonics)
+
+    def fan_out(self, event: Mapping) -> None:
+        event_data = event.get("data", {})
+        rows = event_data.get("content", [])
+
+        with self.lock:
+            subscribers = list(self.subscribers)
+            mnemonics = set(self.mnemonics)
+
+        # The subscribers which were disconnected are removed by the threads serving them
+        for subscriber in subscribers:
+            if not subscriber.is_connected:
+                continue
+
+            foreign_curves = mnemonics - set(subscriber.mnemonics)
+            subscriber_rows = subscriber.project(rows, foreign_curves)
+            if subscriber_rows:
+                message = dict(event, data=dict(event_data, content=subscriber_rows))
+                if not subscriber.offer(message):
+                    logging.warn(
+                        f"Disconnecting a subscriber of {self.event_type}, "
+                        f"which has {max_pending} events waiting to be sent"
+                    )
+                    subscriber.disconnect()
+
+
+def serve(connection: Connection, streams: Dict[str, Stream], lock, settings: Mapping) -> None:
+    try:
+        subscription = connection.recv()
+    except (EOFError, OSError):
+        connection.close()
+        return
+
+    event_type = subscription["event_type"]
+    shape = subscription.get("shape", {})
+    key = json.dumps([event_type, shape], sort_keys=True)
+    subscriber = Subscriber(connection, subscription["mnemonics"])
+
+    # `lock` protects `streams`, the queries are started and stopped after releasing it
+    with lock:
+        stream = streams.get(key)
+        if stream is None:
+            stream = streams[key] = Stream(event_type, shape, settings)
+        stream.add(subscriber)
+
+    try:
+        stream.update_query()
+
+        # Subscribers send nothing else, this only returns when they disconnect
+        connection.recv()
+    except (EOFError, OSError):
+        pass
+    finally:
+        with lock:
+            is_empty = stream.remove(subscriber)
+            if is_empty and (streams.get(key) is stream):
+                del streams[key]
+
+        subscriber.disconnect()
+        subscriber.sender.join()
+        connection.close()
+        if is_empty:
+            stream.update_query()
+
+
+def start(settings: Mapping, **kwargs) -> None:
+    """
+    Accepts subscriptions from the monitors (using `on_event`) on a local socket and
+    keeps a single query to live for each event type, sending the events to the subscribers
+    """
+    setproctitle("DDA: Query multiplexer")
+
+    if os.path.exists(address):
+        os.unlink(address)
+
+    streams: Dict[str, Stream] = {}
+    lock = threading.Lock()
+    listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    logging.info(f"Query multiplexer listening on {address}")
+
+    try:
+        while True:
+            try:
+                connection = listener.accept()
+            except Exception as e:
+                logging.warn(f"Error accepting a subscriber: {e}")
+                continue
+
+            threading.Thread(
+                target=serve, args=(connection, streams, lock, settings), daemon=True
+            ).start()
+    finally:
+        listener.close()
+
+
+##
+# Subscribers
+def connect() -> Optional[Connection]:
+    if address is None:
+        return None
+
+    # The multiplexer may still be starting
+    deadline = monotonic() + CONNECT_TIMEOUT
+    while True:
+        try:
+            return Client(address, family="AF_UNIX", authkey=authkey)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            if monotonic() > deadline:
+                logging.warn(f"Could not connect to the query multiplexer: {e}")
+                return None
+
+            sleep(0.5)
+
+
+def on_event(settings: Mapping, timeout: Optional[float] = DEFAULT_TIMEOUT):
+    """
+    Like `live_client.query.on_event` for the query built by `prepare_query(settings)`,
+    but sharing a single query with the other monitors for the same event type.
+    Falls back to a query of its own when the multiplexer is not enabled.
+    """
+
+    def handler_decorator(f):
+        def wrapper(*args, **kwargs):
+            connection = connect()
+            if connection is None:
+                from live_client import query as live_query
+
+                statement = prepare_query(settings)
+                return live_query.on_event(statement, settings, timeout=timeout)(f)(*args, **kwargs)
+
+            connection.send(build_subscription(settings))
+            last_result = None
+            try:
+                while True:
+                    if not connection.poll(timeout):
+                        logging.warn(f"No results after {timeout} seconds")
+                        break
+
+                    event = connection.recv()
+                    last_result = f(event, *args, **kwargs)
+            except (EOFError, OSError):
+                logging.warn("Connection to the query multiplexer lost")
+            finally:
+                connection.close()
+
+            return last_result
+
+        return wrapper
+
+    return handler_decorator
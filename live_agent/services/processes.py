@@ -1,23 +1,96 @@
 # -*- coding: utf-8 -*-
-from typing import Mapping, Iterable, Callable, Optional, Any
-from multiprocessing import get_context as get_mp_context
-from dataclasses import dataclass
-from time import sleep
-
-from eliot import Action, start_action
+import os
+import json
+import signal
+import asyncio
+from copy import deepcopy
+from typing import Mapping, MutableMapping, Iterable, Callable, Optional, Any, List, Dict, Union
+from multiprocessing import get_context as get_mp_context, active_children
+from multiprocessing.connection import wait
+from dataclasses import dataclass, field, fields
+from time import monotonic
+
+from eliot import Action
 from live_client.utils import logging
 
-from .importer import load_process_handlers
+from .importer import load_process_handlers, load_handler
+from .resources import ResourceLimits, ResourceUsage, sample_usage, check_limits
 from .state import StateManager
+from . import metrics, multiplexer, scheduling, shared_state, state, tracing, zygote
 
 __all__ = ["start", "agent_function"]
 
+ASYNC_WORKER_NAME = "async-worker"
+
+SHUTDOWN_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+RELOAD_SIGNALS = (signal.SIGHUP,)
+
+
+@dataclass
+class RestartPolicy:
+    """
+    Controls how fast a process which has died is restarted.
+
+    The first failure is restarted immediately, the following consecutive failures
+    are delayed exponentially, starting at `initial_delay` and capped at `max_delay`.
+    A process which stays alive for `stable_after` seconds resets the failure count.
+    More than `max_restarts` restarts inside `window` seconds is considered a crash loop,
+    and the process is only restarted after `max_delay`.
+    """
+
+    initial_delay: float = 1
+    max_delay: float = 300
+    multiplier: float = 2
+    stable_after: float = 60
+    max_restarts: int = 5
+    window: float = 60
+
+    def next_delay(self, failures: int, restart_times: List[float], now: float) -> float:
+        if self.is_crash_looping(restart_times, now):
+            return self.max_delay
+
+        if failures <= 1:
+            return 0
+
+        delay = self.initial_delay * (self.multiplier ** (failures - 2))
+        return min(delay, self.max_delay)
+
+    def is_crash_looping(self, restart_times: List[float], now: float) -> bool:
+        recent_restarts = [item for item in restart_times if (now - item) <= self.window]
+        return len(recent_restarts) > self.max_restarts
+
+
+def build_restart_policy(policy_settings: Mapping, name: str) -> RestartPolicy:
+    """
+    Builds the restart policy of a process, ignoring (and logging) the unknown keys
+    instead of failing to start (or reload) the agent
+    """
+    known_keys = set(item.name for item in fields(RestartPolicy))
+    unknown_keys = sorted(set(policy_settings) - known_keys)
+    if unknown_keys:
+        logging.warn(
+            f'Ignoring unknown restart_policy settings for "{name}": {", ".join(unknown_keys)}'
+        )
+
+    return RestartPolicy(
+        **dict((key, value) for key, value in policy_settings.items() if key in known_keys)
+    )
+
 
 @dataclass
 class ProcessSpec:
-    function: Callable
+    function: Union[str, Callable]
     settings: Mapping
     process: Any
+    restart_policy: RestartPolicy = field(default_factory=RestartPolicy)
+    started_at: float = 0
+    next_start_at: Optional[float] = 0
+    failures: int = 0
+    restart_times: List[float] = field(default_factory=list)
+    limits: ResourceLimits = field(default_factory=ResourceLimits)
+    usage: Optional[ResourceUsage] = None
+    terminate_deadline: Optional[float] = None
+    fingerprint: str = ""
 
 
 def filter_dict(source_dict: Mapping, filter_func: Callable) -> Mapping:
@@ -61,62 +134,445 @@ def resolve_process_handlers(global_settings: Mapping):
     return registered_processes
 
 
-def start(global_settings: Mapping) -> Iterable:
-    processes_to_run = resolve_process_handlers(global_settings)
-    num_processes = len(processes_to_run)
-    logging.info(
-        "Starting {} processes: {}".format(num_processes, ", ".join(processes_to_run.keys()))
+def fingerprint_settings(global_settings: Mapping, name: str) -> str:
+    """
+    Summarizes the settings which affect a process, used to detect changes between reloads
+    """
+    process_settings = global_settings.get("processes", {}).get(name, {})
+    live_settings = global_settings.get("live", {})
+    return json.dumps([process_settings, live_settings], sort_keys=True, default=str)
+
+
+def build_process_map(global_settings: Mapping) -> Dict[str, ProcessSpec]:
+    fingerprints = dict(
+        (name, fingerprint_settings(global_settings, name))
+        for name in global_settings.get("processes", {})
     )
+    processes_to_run = resolve_process_handlers(deepcopy(global_settings))
+    scheduling.auto_pin(processes_to_run, global_settings.get("scheduling", {}))
 
     process_map = {}
+    async_process_map = {}
     for name, settings in processes_to_run.items():
         process_func = settings.pop("process_func")
+        metrics.assign(name)
+
+        if settings.get("execution") == "async":
+            ignored_keys = [key for key in ("limits", "scheduling") if key in settings]
+            if ignored_keys:
+                logging.warn(
+                    f'Ignoring the settings {", ".join(ignored_keys)} of "{name}", which runs on '
+                    "the async worker (they can be defined on the key async_worker)"
+                )
+
+            # Executed as a task by the async worker, the process function is called directly
+            async_process_map[name] = ProcessSpec(
+                function=process_func,
+                settings=settings,
+                process=None,
+                restart_policy=build_restart_policy(settings.get("restart_policy", {}), name),
+                fingerprint=fingerprints[name],
+            )
+            continue
 
         process_map[name] = ProcessSpec(
-            function=agent_function(process_func, name=name, with_state=True),
+            function=agent_function(
+                process_func,
+                name=name,
+                with_state=True,
+                scheduling_settings=settings.get("scheduling"),
+            ),
             settings=settings,
             process=None,
+            restart_policy=build_restart_policy(settings.get("restart_policy", {}), name),
+            limits=ResourceLimits(**settings.get("limits", {})),
+            fingerprint=fingerprints[name],
+        )
+
+    if async_process_map:
+        # Imported here because the async worker depends on this module
+        from . import async_worker
+
+        worker_settings = global_settings.get("async_worker", {})
+        metrics.assign(ASYNC_WORKER_NAME)
+        process_map[ASYNC_WORKER_NAME] = ProcessSpec(
+            function=agent_function(
+                async_worker.start,
+                name=ASYNC_WORKER_NAME,
+                scheduling_settings=worker_settings.get("scheduling"),
+            ),
+            settings={"processes": async_process_map},
+            process=None,
+            restart_policy=build_restart_policy(
+                worker_settings.get("restart_policy", {}), ASYNC_WORKER_NAME
+            ),
+            limits=ResourceLimits(**worker_settings.get("limits", {})),
+            fingerprint=json.dumps(
+                [worker_settings] + [item.fingerprint for item in async_process_map.values()],
+                sort_keys=True,
+                default=str,
+            ),
         )
 
-    return monitor_processes(process_map)
+    if multiplexer.address is not None:
+        multiplexer_settings = global_settings.get("multiplexer", {})
+        metrics.assign(multiplexer.PROCESS_NAME)
+        process_map[multiplexer.PROCESS_NAME] = ProcessSpec(
+            function=agent_function(
+                multiplexer.start,
+                name=multiplexer.PROCESS_NAME,
+                scheduling_settings=multiplexer_settings.get("scheduling"),
+            ),
+            settings={"live": global_settings.get("live", {})},
+            process=None,
+            restart_policy=build_restart_policy(
+                multiplexer_settings.get("restart_policy", {}), multiplexer.PROCESS_NAME
+            ),
+            limits=ResourceLimits(**multiplexer_settings.get("limits", {})),
+            fingerprint=json.dumps(
+                [multiplexer_settings, global_settings.get("live", {})],
+                sort_keys=True,
+                default=str,
+            ),
+        )
 
+    return process_map
 
-def monitor_processes(process_map: Mapping, heartbeat_interval: int = 60) -> Iterable:
 
-    while True:
-        for name, process_data in process_map.items():
-            process = process_data.process
+def start(global_settings: Mapping, settings_file: Optional[str] = None) -> Iterable:
+    zygote.preload(global_settings)
+    metrics_settings = global_settings.get("metrics", {})
+    metrics.setup(metrics_settings)
+    state.configure(global_settings.get("state"))
+    shared_state.setup(global_settings.get("shared_state", {}))
+    multiplexer.setup(global_settings.get("multiplexer", {}))
 
-            if process and process.is_alive():
-                logging.info(f'Process for "{name}" (pid={process.pid}) is alive')
+    process_map = build_process_map(global_settings)
+    num_processes = len(process_map)
+    logging.info("Starting {} processes: {}".format(num_processes, ", ".join(process_map.keys())))
 
-            else:
-                if process:
-                    logging.info(f'Process for "{name}" (pid={process.pid}) has died. Restarting')
-                else:
-                    logging.info(f'Starting "{name}" using {process_data.function}')
+    supervisor_settings = global_settings.get("supervisor", {})
+    return monitor_processes(
+        process_map,
+        settings_file=settings_file,
+        metrics_server=metrics.start_server(metrics_settings),
+        **supervisor_settings,
+    )
 
-                process = process_data.function(process_data.settings)
-                try:
-                    process.start()
-                    logging.info(f'Process for "{name}" (pid={process.pid}) started')
-                except OSError as e:
-                    logging.exception(f"Error starting process {name} ({e})")
 
-            process_data.process = process
+def reload_processes(process_map: MutableMapping, settings_file: str, timeout: float) -> None:
+    """
+    Reads the settings again and restarts only the processes whose settings have changed.
+    Processes which were removed (or disabled) are stopped and new ones are started.
+    """
+    try:
+        with open(settings_file, "r") as fd:
+            global_settings = json.load(fd)
+
+        new_process_map = build_process_map(global_settings)
+    except Exception as e:
+        logging.exception(f"Error reloading the settings from {settings_file}, ignoring ({e})")
+        return
+
+    removed = [name for name in process_map if name not in new_process_map]
+    added = [name for name in new_process_map if name not in process_map]
+    changed = [
+        name
+        for name, process_data in new_process_map.items()
+        if (name in process_map) and (process_data.fingerprint != process_map[name].fingerprint)
+    ]
+    logging.info(
+        "Settings reloaded. Added: {}; Removed: {}; Changed: {}".format(
+            added or "-", removed or "-", changed or "-"
+        )
+    )
 
-        sleep(heartbeat_interval)
+    stop_processes(dict((name, process_map[name]) for name in removed + changed), timeout=timeout)
+    for name in removed:
+        del process_map[name]
+
+    for name in added + changed:
+        process_map[name] = new_process_map[name]
+
+
+def mark_started(name: str, process_data: ProcessSpec) -> None:
+    now = monotonic()
+    if process_data.started_at:
+        logging.info(f'Restarting "{name}"')
+        process_data.restart_times = [
+            item
+            for item in process_data.restart_times
+            if (now - item) <= process_data.restart_policy.window
+        ] + [now]
+    else:
+        logging.info(f'Starting "{name}" using {process_data.function}')
+
+    process_data.started_at = now
+    process_data.next_start_at = None
+    process_data.usage = None
+
+
+def start_process(name: str, process_data: ProcessSpec) -> None:
+    mark_started(name, process_data)
+    process_data.process = process_data.function(process_data.settings)
+
+    try:
+        process_data.process.start()
+        logging.info(f'Process for "{name}" (pid={process_data.process.pid}) started')
+    except Exception as e:
+        logging.exception(f"Error starting process {name} ({e})")
+        process_data.process = None
+        schedule_restart(name, process_data)
+
+
+def schedule_restart(name: str, process_data: ProcessSpec) -> None:
+    now = monotonic()
+    policy = process_data.restart_policy
+    if (now - process_data.started_at) >= policy.stable_after:
+        process_data.failures = 0
+    process_data.failures += 1
+
+    if policy.is_crash_looping(process_data.restart_times, now):
+        logging.error(
+            f'Process for "{name}" is crash looping '
+            f"({len(process_data.restart_times)} restarts in the last {policy.window}s)"
+        )
 
-    running_processes = [item["process"] for item in process_map.values()]
-    return running_processes
+    delay = policy.next_delay(process_data.failures, process_data.restart_times, now)
+    logging.info(f'Process for "{name}" will be restarted in {delay:.1f}s')
+    metrics.inc("restarts_total", name=name)
+    process_data.next_start_at = now + delay
 
 
-def agent_function(f: Callable, name: Optional[str] = None, with_state: bool = False) -> Callable:
+def handle_process_exit(name: str, process_data: ProcessSpec) -> None:
+    process = process_data.process
+    process.join()
+
+    if process_data.terminate_deadline is not None:
+        logging.info(f'Process for "{name}" (pid={process.pid}) was recycled')
+        process_data.terminate_deadline = None
+    else:
+        logging.info(
+            f'Process for "{name}" (pid={process.pid}) has died with exitcode={process.exitcode}'
+        )
+
+    schedule_restart(name, process_data)
+
+
+def recycle_process(name: str, process_data: ProcessSpec, termination_timeout: float) -> None:
+    """
+    Asks a process to stop, so it is restarted after flushing its state.
+    It is killed if it is still alive after `termination_timeout` seconds.
+    """
+    process = process_data.process
+    logging.info(f'Recycling process for "{name}" (pid={process.pid})')
+    process_data.terminate_deadline = monotonic() + termination_timeout
+    process.terminate()
+
+
+def kill_overdue_processes(process_map: Mapping) -> None:
+    now = monotonic()
+    for name, process_data in process_map.items():
+        process = process_data.process
+        is_overdue = (process_data.terminate_deadline is not None) and (
+            process_data.terminate_deadline <= now
+        )
+        if is_overdue and process.is_alive():
+            logging.error(f'Process for "{name}" (pid={process.pid}) did not stop. Killing it')
+            process.kill()
+
+
+def enforce_limits(process_map: Mapping, termination_timeout: float) -> None:
+    running_processes = dict(
+        (process_data.process.pid, (name, process_data))
+        for name, process_data in process_map.items()
+        if (process_data.next_start_at is None) and process_data.process
+    )
+    previous_usages = dict(
+        (pid, process_data.usage)
+        for pid, (name, process_data) in running_processes.items()
+        if process_data.usage is not None
+    )
+
+    usages = sample_usage(list(running_processes.keys()), previous_usages)
+    for pid, usage in usages.items():
+        name, process_data = running_processes[pid]
+        process_data.usage = usage
+
+        exceeded_limits = check_limits(process_data.limits, usage)
+        if exceeded_limits:
+            logging.error(
+                'Process for "{}" (pid={}) exceeded its limits: {} ({})'.format(
+                    name, pid, ", ".join(exceeded_limits), usage
+                )
+            )
+
+        is_recycling = process_data.terminate_deadline is not None
+        if (usage.violations >= process_data.limits.tolerance) and not is_recycling:
+            recycle_process(name, process_data, termination_timeout)
+
+
+def install_signal_handlers() -> int:
+    """
+    Makes the signals handled by the supervisor wake it up, writing the signal
+    numbers to a pipe. Returns the file descriptor which should be read.
+    """
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    os.set_blocking(write_fd, False)
+
+    signal.set_wakeup_fd(write_fd)
+    for signum in SHUTDOWN_SIGNALS + RELOAD_SIGNALS:
+        signal.signal(signum, lambda *args: None)
+
+    # Forked processes should not wake the supervisor up with their own signals
+    os.register_at_fork(after_in_child=reset_signal_handlers)
+    return read_fd
+
+
+def reset_signal_handlers() -> None:
+    signal.set_wakeup_fd(-1)
+    for signum in SHUTDOWN_SIGNALS + RELOAD_SIGNALS:
+        signal.signal(signum, signal.SIG_DFL)
+
+
+def read_signals(signal_fd: int) -> List[int]:
+    try:
+        return list(os.read(signal_fd, 512))
+    except BlockingIOError:
+        return []
+
+
+def stop_processes(process_map: Mapping, timeout: float = 10) -> List:
+    """
+    Asks all processes to stop at the same time and waits for them until a global deadline.
+    Processes which are still alive after `timeout` seconds are killed.
+    """
+    running_processes = dict(
+        (process_data.process.sentinel, (name, process_data.process))
+        for name, process_data in process_map.items()
+        if process_data.process and process_data.process.is_alive()
+    )
+    logging.info(f"Stopping {len(running_processes)} processes")
+
+    for name, process in running_processes.values():
+        process.terminate()
+
+    deadline = monotonic() + timeout
+    pending = dict(running_processes)
+    while pending:
+        remaining_time = deadline - monotonic()
+        if remaining_time <= 0:
+            break
+
+        for sentinel in wait(list(pending.keys()), timeout=remaining_time):
+            name, process = pending.pop(sentinel)
+            process.join()
+            logging.info(f'Process for "{name}" (pid={process.pid}) stopped')
+
+    for name, process in pending.values():
+        logging.error(f'Process for "{name}" (pid={process.pid}) did not stop. Killing it')
+        process.kill()
+        process.join()
+
+    return [process for name, process in running_processes.values()]
+
+
+def monitor_processes(
+    process_map: Mapping,
+    heartbeat_interval: float = 60,
+    sampling_interval: float = 10,
+    termination_timeout: float = 10,
+    shutdown_timeout: float = 10,
+    settings_file: Optional[str] = None,
+    metrics_server: Optional[Any] = None,
+) -> Iterable:
+    signal_fd = install_signal_handlers()
+    next_heartbeat = monotonic() + heartbeat_interval
+    next_sampling = monotonic() + sampling_interval
+
+    while True:
+        now = monotonic()
+        for name, process_data in process_map.items():
+            is_due = (process_data.next_start_at is not None) and (
+                process_data.next_start_at <= now
+            )
+            if is_due:
+                start_process(name, process_data)
+
+        kill_overdue_processes(process_map)
+
+        if now >= next_sampling:
+            enforce_limits(process_map, termination_timeout)
+            next_sampling = now + sampling_interval
+
+        if now >= next_heartbeat:
+            for name, process_data in process_map.items():
+                process = process_data.process
+                if process and process.is_alive():
+                    logging.info(
+                        f'Process for "{name}" (pid={process.pid}) is alive ({process_data.usage})'
+                    )
+            next_heartbeat = now + heartbeat_interval
+
+        # Sleep until a process dies, a signal arrives, a restart is due,
+        # or it is time to sample or log
+        pending_starts = [
+            item.next_start_at for item in process_map.values() if item.next_start_at is not None
+        ]
+        pending_kills = [
+            item.terminate_deadline
+            for item in process_map.values()
+            if item.terminate_deadline is not None
+        ]
+        next_wakeup = min([next_heartbeat, next_sampling] + pending_starts + pending_kills)
+        timeout = max(next_wakeup - monotonic(), 0)
+
+        sentinels = dict(
+            (process_data.process.sentinel, name)
+            for name, process_data in process_map.items()
+            if (process_data.next_start_at is None) and process_data.process
+        )
+        wait_list = list(sentinels.keys()) + [signal_fd]
+        ready = wait(wait_list, timeout=timeout)
+
+        received_signals = (signal_fd in ready) and read_signals(signal_fd) or []
+        if any(signum in SHUTDOWN_SIGNALS for signum in received_signals):
+            logging.info(f"Received signals {received_signals}, shutting down")
+            break
+
+        if any(signum in RELOAD_SIGNALS for signum in received_signals):
+            if settings_file:
+                reload_processes(process_map, settings_file, timeout=shutdown_timeout)
+                continue
+            else:
+                logging.warn("Cannot reload the settings, the settings file is unknown")
+
+        for sentinel in ready:
+            if sentinel in sentinels:
+                name = sentinels[sentinel]
+                handle_process_exit(name, process_map[name])
+
+    if metrics_server is not None:
+        metrics_server.shutdown()
+        metrics_server.server_close()
+
+    return stop_processes(process_map, timeout=shutdown_timeout)
+
+
+def agent_function(
+    f: Union[str, Callable],
+    name: Optional[str] = None,
+    with_state: bool = False,
+    scheduling_settings: Optional[Mapping] = None,
+) -> Callable:
     mp = get_mp_context("fork")
 
     def wrapped(*args, **kwargs):
         try:
-            f_in_action = inside_action(f, name=name, with_state=with_state)
+            f_in_action = inside_action(
+                f, name=name, with_state=with_state, scheduling_settings=scheduling_settings
+            )
             return mp.Process(target=f_in_action, args=args, kwargs=kwargs)
         except Exception as e:
             logging.exception(f"Error during the execution of {f}: <{e}>")
@@ -124,28 +580,60 @@ def agent_function(f: Callable, name: Optional[str] = None, with_state: bool = F
     return wrapped
 
 
-def inside_action(f: Callable, name: Optional[str] = None, with_state: bool = False) -> Callable:
+def inside_action(
+    f: Union[str, Callable],
+    name: Optional[str] = None,
+    with_state: bool = False,
+    scheduling_settings: Optional[Mapping] = None,
+) -> Callable:
     if name is None:
-        name = f"{f.__module__}.{f.__name__}"
+        name = f if isinstance(f, str) else f"{f.__module__}.{f.__name__}"
 
     def wrapped(*args, **kwargs):
         task_id = kwargs.get("task_id")
         if task_id:
             action = Action.continue_task(task_id=task_id)
         else:
-            action = start_action(action_type=name)
+            action = tracing.start_action(name)
+
+        signal.signal(signal.SIGTERM, exit_on_sigterm)
+        scheduling.apply(scheduling_settings)
+        metrics.bind(name)
 
         with action.context():
             task_id = action.serialize_task_id()
             kwargs["task_id"] = task_id
             if with_state:
-                kwargs["state_manager"] = StateManager(name)
+                state_manager = StateManager(name)
+                kwargs["state_manager"] = state_manager
 
             try:
-                return f(*args, **kwargs)
+                # Handlers declared as import paths are only imported by the process using them
+                result = load_handler(f)(*args, **kwargs)
+
+                # Coroutine handlers (which may also run on the async worker) get their own loop
+                if asyncio.iscoroutine(result):
+                    result = asyncio.run(result)
+
+                return result
             except Exception as e:
                 logging.exception(f"Error during the execution of {f}: <{e}>")
+            finally:
+                if with_state:
+                    state_manager.flush()
 
         action.finish()
 
     return wrapped
+
+
+def exit_on_sigterm(signum, frame):
+    """
+    Turns SIGTERM into a clean exit, so the pending state of the process is saved.
+    The processes it started are asked to stop as well.
+    """
+    for child in active_children():
+        child.terminate()
+
+    logging.info(f"Received signal {signum}, exiting")
+    raise SystemExit(0)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+import io
+import sys
+import signal
+import pstats
+import cProfile
+import tempfile
+from copy import deepcopy
+from multiprocessing import get_context as get_mp_context, active_children
+from time import perf_counter
+from typing import Any, Dict, List, Mapping, Tuple
+
+from live_client.utils import logging
+
+from .importer import load_handler
+from .processes import resolve_process_handlers
+from .state import StateManager
+from . import state, tracing
+
+__all__ = ["profile_startup"]
+
+# Time for each profiled process to stop after `duration`
+STOP_MARGIN = 5
+
+# The functions from live_client which query or send data to live. The profiled processes stop
+# when they are first called, since the main loop of the process is starting
+LIVE_ENTRY_POINTS = {
+    "live_client.query.query": ["start"],
+    "live_client.connection.rest_input": ["build_session", "send_event"],
+    "live_client.connection.tcp_input": ["send_event"],
+    "live_client.utils.http": ["build_session"],
+}
+
+
+class ProfilingTimeout(BaseException):
+    """
+    Stops the profiled process. Not an `Exception`, so the handlers do not catch it
+    """
+
+
+class LiveCallReached(BaseException):
+    """
+    Stops the profiled process when it tries to query or send data to live
+    """
+
+
+class ImportTimer:
+    """
+    Measures the time spent executing each module imported while it is installed
+    on `sys.meta_path`. The self time of a module excludes the modules imported by it.
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, Tuple[float, float]] = {}
+        self.stack: List[list] = []
+
+    def install(self) -> None:
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self) -> None:
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            find_spec = getattr(finder, "find_spec", None)
+            if (finder is self) or (find_spec is None):
+                continue
+
+            spec = find_spec(fullname, path, target)
+            if spec is not None:
+                if hasattr(spec.loader, "exec_module"):
+                    spec.loader = TimedLoader(spec.loader, self)
+                return spec
+
+        return None
+
+    def enter(self, name: str) -> None:
+        self.stack.append([name, perf_counter(), 0.0])
+
+    def leave(self) -> None:
+        name, started_at, children_time = self.stack.pop()
+        elapsed = perf_counter() - started_at
+        self.timings[name] = (elapsed - children_time, elapsed)
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    @property
+    def total_time(self) -> float:
+        return sum(self_time for self_time, cumulative_time in self.timings.values())
+
+
+class TimedLoader:
+    def __init__(self, loader: Any, timer: ImportTimer):
+        self.loader = loader
+        self.timer = timer
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.timer.enter(module.__name__)
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.timer.leave()
+
+        # Before other modules import the names from it
+        stub_live_calls(module)
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+
+def raise_timeout(signum, frame):
+    raise ProfilingTimeout()
+
+
+def stub_live_calls(module: Any) -> None:
+    for attribute in LIVE_ENTRY_POINTS.get(module.__name__, []):
+        function_name = f"{module.__name__}.{attribute}"
+
+        def stub(*args, function_name=function_name, **kwargs):
+            raise LiveCallReached(function_name)
+
+        setattr(module, attribute, stub)
+
+
+def format_report(
+    name: str,
+    status: str,
+    elapsed: float,
+    import_timer: ImportTimer,
+    profiler: cProfile.Profile,
+    limit: int,
+) -> str:
+    lines = [
+        f'== Process "{name}": {status} after {elapsed:.2f}s, '
+        f"{import_timer.total_time:.2f}s importing {len(import_timer.timings)} modules",
+        "",
+        f"Slowest imports:\n{'self (s)':>10}{'cumul. (s)':>12}  module",
+    ]
+    ranked_imports = sorted(import_timer.timings.items(), key=lambda item: item[1], reverse=True)
+    for module_name, (self_time, cumulative_time) in ranked_imports[:limit]:
+        lines.append(f"{self_time:>10.3f}{cumulative_time:>12.3f}  {module_name}")
+
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats("cumulative").print_stats(limit)
+    lines.extend(["", "Slowest functions (including the imports):", stream.getvalue()])
+
+    return "\n".join(lines)
+
+
+def profile_process(name: str, settings: Mapping, duration: float, limit: int) -> None:
+    """
+    Runs the initialization of a process under an import timer and cProfile, and prints
+    the results. The process is stopped when it first tries to query or send data to live
+    (which is not done), finishes, fails or `duration` seconds have passed.
+    """
+    process_func = settings.pop("process_func")
+    import_timer = ImportTimer()
+    profiler = cProfile.Profile()
+    status = "finished"
+
+    signal.signal(signal.SIGALRM, raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, duration)
+    started_at = perf_counter()
+
+    # Modules imported before the fork are stubbed here, the others as soon as they are imported
+    for module_name in LIVE_ENTRY_POINTS:
+        if module_name in sys.modules:
+            stub_live_calls(sys.modules[module_name])
+
+    with tempfile.TemporaryDirectory() as state_directory:
+        import_timer.install()
+        profiler.enable()
+        try:
+            with tracing.start_action(name) as action:
+                # States are not shared with the running agent
+                state_manager = StateManager(name, directory=state_directory)
+                kwargs = dict(task_id=action.serialize_task_id(), state_manager=state_manager)
+                load_handler(process_func)(settings, **kwargs)
+        except LiveCallReached as e:
+            status = f"initialized (stopped when calling {e})"
+        except ProfilingTimeout:
+            status = "stopped"
+        except Exception as e:
+            status = f"failed ({e})"
+        finally:
+            profiler.disable()
+            import_timer.uninstall()
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    elapsed = perf_counter() - started_at
+    print(format_report(name, status, elapsed, import_timer, profiler, limit), flush=True)
+
+    # Processes started during the initialization, like the chatbot's room bots
+    for item in active_children():
+        item.terminate()
+        item.join(STOP_MARGIN)
+
+
+def profile_startup(global_settings: Mapping, duration: float = 10, limit: int = 20) -> None:
+    """
+    Profiles the initialization of each enabled process, one at a time,
+    on forked processes which are stopped after `duration` seconds
+    """
+    mp = get_mp_context("fork")
+    state.configure(global_settings.get("state"))
+    processes_to_run = resolve_process_handlers(deepcopy(global_settings))
+
+    for name, settings in processes_to_run.items():
+        logging.info(f'Profiling the initialization of "{name}"')
+        process = mp.Process(target=profile_process, args=(name, settings, duration, limit))
+        process.start()
+        process.join(duration + STOP_MARGIN)
+
+        if process.is_alive():
+            print(f'== Process "{name}" did not stop after {duration}s, killing it', flush=True)
+            process.kill()
+            process.join()
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+import os
+from dataclasses import dataclass
+from typing import Mapping, Optional, List, Dict
+from time import monotonic
+
+__all__ = ["ResourceLimits", "ResourceUsage", "sample_usage", "check_limits"]
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+MEGABYTE = 1024 * 1024
+KILOBYTE = 1024
+
+# Not available on older kernels (or kernels built without CONFIG_PROC_CHILDREN)
+HAS_CHILDREN_LISTS = os.path.exists(f"/proc/self/task/{os.getpid()}/children")
+HAS_SMAPS_ROLLUP = os.path.exists("/proc/self/smaps_rollup")
+
+
+@dataclass
+class ResourceLimits:
+    """
+    Limits for a managed process, including the processes it has forked.
+
+    `max_rss` is measured in megabytes (as the proportional set size, so the pages shared
+    between the processes are not counted once for each of them) and `max_cpu_share`
+    as a fraction of one cpu, averaged between two samples. A process is recycled after exceeding a limit
+    on `tolerance` consecutive samples.
+    """
+
+    max_rss: Optional[float] = None
+    max_cpu_share: Optional[float] = None
+    max_open_fds: Optional[int] = None
+    tolerance: int = 1
+
+
+@dataclass
+class ResourceUsage:
+    memory: int = 0
+    cpu_time: float = 0
+    open_fds: int = 0
+    cpu_share: float = 0
+    sampled_at: float = 0
+    violations: int = 0
+
+    def __str__(self):
+        return "memory={:.1f}MB, cpu={:.0%}, fds={}".format(
+            self.memory / MEGABYTE, self.cpu_share, self.open_fds
+        )
+
+
+def read_process_stat(pid: int) -> Optional[List[str]]:
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            content = f.read()
+    except OSError:
+        return None
+
+    # The process name may contain spaces, the other fields come after its closing paren
+    return content[content.rindex(")") + 2 :].split()
+
+
+def read_memory(pid: int, stat: List[str]) -> int:
+    """
+    The proportional set size of the process, or its rss when it is not available
+    """
+    if HAS_SMAPS_ROLLUP:
+        try:
+            with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        return int(line.split()[1]) * KILOBYTE
+        except OSError:
+            pass
+
+    # Field 24 (rss), after removing pid and name
+    return int(stat[21]) * PAGE_SIZE
+
+
+def list_children(pid: int) -> List[int]:
+    children = []
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return children
+
+    for task in tasks:
+        try:
+            with open(f"/proc/{pid}/task/{task}/children", "r") as f:
+                children.extend(int(item) for item in f.read().split())
+        except OSError:
+            continue
+
+    return children
+
+
+def scan_children() -> Dict[int, List[int]]:
+    """
+    Maps each process on the host to its children, reading the stat of every process
+    """
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+
+        stat = read_process_stat(int(entry))
+        if stat:
+            parent_pid = int(stat[1])
+            children.setdefault(parent_pid, []).append(int(entry))
+
+    return children
+
+
+def list_descendants(pids: List[int]) -> Dict[int, List[int]]:
+    if HAS_CHILDREN_LISTS:
+        get_children = list_children
+    else:
+        get_children = scan_children().get
+
+    descendants = {}
+    for pid in pids:
+        process_tree = []
+        pending = [pid]
+        while pending:
+            item = pending.pop()
+            process_tree.append(item)
+            pending.extend(get_children(item) or [])
+
+        descendants[pid] = process_tree
+
+    return descendants
+
+
+def count_open_fds(pid: int) -> int:
+    try:
+        return len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        return 0
+
+
+def sample_process_tree(pids: List[int]) -> ResourceUsage:
+    usage = ResourceUsage(sampled_at=monotonic())
+
+    for pid in pids:
+        stat = read_process_stat(pid)
+        if not stat:
+            continue
+
+        # Fields 14 and 15 (utime and stime), after removing pid and name
+        usage.cpu_time += (int(stat[11]) + int(stat[12])) / CLOCK_TICKS
+        usage.memory += read_memory(pid, stat)
+        usage.open_fds += count_open_fds(pid)
+
+    return usage
+
+
+def sample_usage(
+    pids: List[int], previous: Mapping[int, ResourceUsage]
+) -> Dict[int, ResourceUsage]:
+    """
+    Samples the resources used by each pid and its descendants, using `/proc`
+    """
+    process_trees = list_descendants(pids)
+
+    usages = {}
+    for pid, process_tree in process_trees.items():
+        usage = sample_process_tree(process_tree)
+        last_usage = previous.get(pid)
+
+        if last_usage is not None:
+            elapsed_time = usage.sampled_at - last_usage.sampled_at
+            if elapsed_time > 0:
+                usage.cpu_share = max(usage.cpu_time - last_usage.cpu_time, 0) / elapsed_time
+            usage.violations = last_usage.violations
+
+        usages[pid] = usage
+
+    return usages
+
+
+def check_limits(limits: ResourceLimits, usage: ResourceUsage) -> List[str]:
+    exceeded = []
+    if (limits.max_rss is not None) and (usage.memory > limits.max_rss * MEGABYTE):
+        exceeded.append(f"memory above {limits.max_rss}MB")
+
+    if (limits.max_cpu_share is not None) and (usage.cpu_share > limits.max_cpu_share):
+        exceeded.append(f"cpu share above {limits.max_cpu_share:.0%}")
+
+    if (limits.max_open_fds is not None) and (usage.open_fds > limits.max_open_fds):
+        exceeded.append(f"more than {limits.max_open_fds} open fds")
+
+    if exceeded:
+        usage.violations += 1
+    else:
+        usage.violations = 0
+
+    return exceeded
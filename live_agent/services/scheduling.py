@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import os
+import ctypes
+import platform
+from typing import Mapping, Optional
+
+from live_client.utils import logging
+
+__all__ = ["apply", "auto_pin"]
+
+# Values from linux/ioprio.h
+IOPRIO_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_SET_SYSCALLS = {
+    "x86_64": 251,
+    "i386": 289,
+    "i686": 289,
+    "aarch64": 30,
+    "armv7l": 314,
+    "ppc64le": 273,
+}
+
+
+def set_io_priority(io_class: str, level: int = 4) -> None:
+    syscall_number = IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if syscall_number is None:
+        raise OSError(f"ioprio_set is not supported on {platform.machine()}")
+
+    if io_class not in IOPRIO_CLASSES:
+        raise ValueError(f"Invalid io class {io_class}, use one of {list(IOPRIO_CLASSES)}")
+
+    io_priority = (IOPRIO_CLASSES[io_class] << IOPRIO_CLASS_SHIFT) | level
+    libc = ctypes.CDLL(None, use_errno=True)
+    result = libc.syscall(syscall_number, IOPRIO_WHO_PROCESS, 0, io_priority)
+    if result != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+
+def apply(scheduling_settings: Optional[Mapping]) -> None:
+    """
+    Applies the scheduling hints to the current process. Eg:
+
+      "scheduling": {"cpus": [2, 3], "nice": 10, "ionice": {"class": "idle"}}
+    """
+    if not scheduling_settings:
+        return
+
+    cpus = scheduling_settings.get("cpus")
+    nice = scheduling_settings.get("nice")
+    ionice = scheduling_settings.get("ionice")
+
+    try:
+        if cpus:
+            os.sched_setaffinity(0, cpus)
+
+        if nice is not None:
+            os.setpriority(os.PRIO_PROCESS, 0, nice)
+
+        if ionice:
+            set_io_priority(ionice.get("class", "best-effort"), ionice.get("level", 4))
+
+        logging.debug(f"Scheduling settings applied: {scheduling_settings}")
+    except (OSError, ValueError) as e:
+        logging.error(f"Error applying scheduling settings {scheduling_settings}: {e}")
+
+
+def auto_pin(processes_settings: Mapping, global_scheduling_settings: Mapping) -> None:
+    """
+    Pins each process without a cpu set of its own to a single cpu, distributing them
+    among the cpus available for the agent (or the ones listed on the global settings).
+    The processes executed by the async worker are skipped, since they run on its process.
+    """
+    if not global_scheduling_settings.get("auto_pin", False):
+        return
+
+    available_cpus = sorted(global_scheduling_settings.get("cpus") or os.sched_getaffinity(0))
+    unpinned_processes = [
+        settings
+        for settings in processes_settings.values()
+        if (settings.get("execution") != "async") and not settings.get("scheduling", {}).get("cpus")
+    ]
+
+    for index, settings in enumerate(unpinned_processes):
+        scheduling_settings = dict(settings.get("scheduling", {}))
+        scheduling_settings.update(cpus=[available_cpus[index % len(available_cpus)]])
+        settings.update(scheduling=scheduling_settings)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+import os
+import mmap
+import pickle
+import struct
+import threading
+from time import monotonic
+from multiprocessing import get_context as get_mp_context
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from live_client.utils import logging
+
+__all__ = ["setup", "publish", "read", "read_versioned"]
+
+KEY_SIZE = 128
+OWNER_OFFSET = KEY_SIZE
+VERSION_OFFSET = KEY_SIZE + 8
+LENGTH_OFFSET = KEY_SIZE + 16
+HEADER_SIZE = KEY_SIZE + 32
+READ_TIMEOUT = 1.0
+
+# Created by the supervisor before forking, shared by all processes
+namespace = None
+
+
+class SharedNamespace:
+    """
+    A table of values stored on shared memory, which can be read by every process.
+    Each key has a single writer and any number of readers. The writes are protected by a
+    version counter, which is odd while the value is being written (a seqlock), so readers
+    never block and retry when they see a value being updated.
+    """
+
+    def __init__(self, max_keys: int = 256, max_value_size: int = 65536):
+        self.max_keys = max_keys
+        self.max_value_size = max_value_size
+        self.slot_size = HEADER_SIZE + max_value_size
+        self.buffer = mmap.mmap(-1, max_keys * self.slot_size)
+        self.allocation_lock = get_mp_context("fork").Lock()
+        self.write_lock = threading.Lock()
+        self.slots: Dict[str, int] = {}
+        # The owners which prevented this process from publishing each key, reported only once
+        self.blocking_owners: Dict[str, int] = {}
+
+        os.register_at_fork(after_in_child=self.reset_after_fork)
+
+    def reset_after_fork(self) -> None:
+        self.write_lock = threading.Lock()
+        self.blocking_owners = {}
+
+    def read_key(self, slot: int) -> str:
+        offset = slot * self.slot_size
+        return self.buffer[offset : offset + KEY_SIZE].rstrip(b"\0").decode("utf-8")
+
+    def read_header(self, slot: int, field_offset: int) -> int:
+        return struct.unpack_from("<Q", self.buffer, slot * self.slot_size + field_offset)[0]
+
+    def write_header(self, slot: int, field_offset: int, value: int) -> None:
+        struct.pack_into("<Q", self.buffer, slot * self.slot_size + field_offset, value)
+
+    def find_slot(self, key: str, create: bool = False) -> Optional[int]:
+        slot = self.slots.get(key)
+        if slot is not None:
+            return slot
+
+        encoded_key = key.encode("utf-8")
+        if create and (len(encoded_key) > KEY_SIZE):
+            logging.warn(f"Shared state keys are limited to {KEY_SIZE} bytes, got {key}")
+            return None
+
+        # Keys are written by other processes, so they are only scanned while none is allocated
+        with self.allocation_lock:
+            for slot in range(self.max_keys):
+                slot_key = self.read_key(slot)
+                if slot_key:
+                    self.slots[slot_key] = slot
+                    continue
+
+                if (key not in self.slots) and create:
+                    offset = slot * self.slot_size
+                    self.buffer[offset : offset + len(encoded_key)] = encoded_key
+                    self.slots[key] = slot
+                break
+
+        slot = self.slots.get(key)
+        if (slot is None) and create:
+            logging.warn(f"No shared state slots left for {key}")
+
+        return slot
+
+    def claim(self, key: str, slot: int) -> bool:
+        """
+        Makes this process the owner of a slot, unless it is owned by another live process
+        """
+        pid = os.getpid()
+        if self.read_header(slot, OWNER_OFFSET) == pid:
+            return True
+
+        # The owner is checked and replaced atomically, so two processes cannot both claim it
+        with self.allocation_lock:
+            owner = self.read_header(slot, OWNER_OFFSET)
+            if owner not in (0, pid) and is_alive(owner):
+                if self.blocking_owners.get(key) != owner:
+                    logging.warn(
+                        f"Shared state key {key} is owned by process {owner}, not publishing"
+                    )
+                    self.blocking_owners[key] = owner
+                return False
+
+            self.write_header(slot, OWNER_OFFSET, pid)
+
+        self.blocking_owners.pop(key, None)
+        return True
+
+    def publish(self, key: str, value: Any) -> bool:
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_value_size:
+            logging.warn(f"Value for {key} is too big for the shared state ({len(data)} bytes)")
+            return False
+
+        slot = self.find_slot(key, create=True)
+        if slot is None:
+            return False
+
+        if not self.claim(key, slot):
+            return False
+
+        with self.write_lock:
+            version = self.read_header(slot, VERSION_OFFSET)
+            # An odd version means the previous owner died while writing
+            version += 1 + (version % 2)
+
+            self.write_header(slot, VERSION_OFFSET, version)
+            offset = slot * self.slot_size + HEADER_SIZE
+            self.buffer[offset : offset + len(data)] = data
+            self.write_header(slot, LENGTH_OFFSET, len(data))
+            self.write_header(slot, VERSION_OFFSET, version + 1)
+
+        return True
+
+    def read(self, key: str, default: Any = None) -> Tuple[int, Any]:
+        slot = self.find_slot(key)
+        if slot is None:
+            return 0, default
+
+        offset = slot * self.slot_size + HEADER_SIZE
+        deadline = None
+        while True:
+            version = self.read_header(slot, VERSION_OFFSET)
+            if version % 2 == 0:
+                length = self.read_header(slot, LENGTH_OFFSET)
+                data = self.buffer[offset : offset + min(length, self.max_value_size)]
+                if self.read_header(slot, VERSION_OFFSET) == version:
+                    if not data:
+                        return 0, default
+
+                    try:
+                        return version // 2, pickle.loads(data)
+                    except Exception:
+                        # A write which was not seen by the version check, read it again
+                        pass
+
+            # The writer may have been preempted (or died) while updating the value
+            if deadline is None:
+                deadline = monotonic() + READ_TIMEOUT
+            elif monotonic() > deadline:
+                logging.warn(f"Could not read a consistent value for {key} from the shared state")
+                return 0, default
+
+            os.sched_yield()
+
+
+def is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+def setup(shared_state_settings: Mapping) -> Optional[SharedNamespace]:
+    global namespace
+
+    if shared_state_settings.get("enabled", False):
+        namespace = SharedNamespace(
+            max_keys=shared_state_settings.get("max_keys", 256),
+            max_value_size=shared_state_settings.get("max_value_size", 65536),
+        )
+
+    return namespace
+
+
+def publish(key: str, value: Any) -> bool:
+    """
+    Makes `value` available to all processes. Only one process can publish each key,
+    returns `False` when it is owned by another process (or the value was not published).
+    """
+    if namespace is None:
+        return False
+
+    return namespace.publish(key, value)
+
+
+def read(key: str, default: Any = None) -> Any:
+    if namespace is None:
+        return default
+
+    version, value = namespace.read(key, default)
+    return value
+
+
+def read_versioned(key: str, default: Any = None) -> Tuple[int, Any]:
+    """
+    Returns the value for `key` and the number of times it was published
+    """
+    if namespace is None:
+        return 0, default
+
+    return namespace.read(key, default)
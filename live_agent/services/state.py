@@ -1,62 +1,342 @@
 # -*- coding: utf-8 -*-
+import os
 import time
+import pickle
+import sqlite3
+import tempfile
+import threading
+from copy import deepcopy
 from hashlib import md5
-from typing import Mapping, Dict, Union, AnyStr, Any
+from typing import Mapping, Dict, Union, AnyStr, Any, Optional
 
 import dill
 from live_client.utils import logging
 
-__all__ = ["StateManager"]
+from . import codecs, metrics
+
+__all__ = ["StateManager", "configure"]
 
 number = Union[int, float]
 
 TIMESTAMP_KEY = "__timestamp"
+LEGACY_DIRECTORY = "/tmp"
+
+# Defined by the supervisor before forking, using the key `state` from the settings
+state_directory = LEGACY_DIRECTORY
+state_backend = "sqlite"
+state_codec = "dill"
+state_write_behind = False
+state_flush_interval = 0.5
+
+
+class FileStateStore:
+    """
+    Stores the whole state on a single file, which is replaced atomically on each save
+    """
+
+    def __init__(self, directory: str, basename: str, codec: str = "dill"):
+        self.filename = os.path.join(directory, f"{basename}.live_agent")
+        self.codec = codec
+
+    def load(self) -> Dict[str, Any]:
+        with open(self.filename, r"r+b") as f:
+            return codecs.decode(f.read())
+
+    def save(self, state: Mapping[str, Any]) -> int:
+        data = codecs.encode(state, self.codec)
+        directory, basename = os.path.split(self.filename)
+        fd, temp_filename = tempfile.mkstemp(prefix=f".{basename}.", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_filename, self.filename)
+        except BaseException:
+            os.unlink(temp_filename)
+            raise
+
+        return len(data)
+
+
+class SqliteStateStore:
+    """
+    Stores each key of the state as a row of a sqlite table.
+    Only the keys whose values have changed since the last save are written,
+    inside a single transaction.
+    """
+
+    def __init__(self, directory: str, basename: str, codec: str = "dill"):
+        self.filename = os.path.join(directory, f"{basename}.sqlite3")
+        self.codec = codec
+        self.connection = None
+        self.connection_pid = None
+        self.saved_values = None
+
+    def connect(self) -> sqlite3.Connection:
+        # Connections cannot be shared with forked processes
+        if (self.connection is None) or (self.connection_pid != os.getpid()):
+            # Used by the write-behind thread as well, always under `StateManager.write_lock`
+            self.connection = sqlite3.connect(
+                self.filename, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value BLOB NOT NULL)"
+            )
+            self.connection_pid = os.getpid()
+            self.saved_values = None
+
+        return self.connection
+
+    def read_values(self) -> Dict[str, bytes]:
+        connection = self.connect()
+        return dict(connection.execute("SELECT key, value FROM state"))
+
+    def load(self) -> Dict[str, Any]:
+        self.saved_values = self.read_values()
+        return dict((key, codecs.decode(value)) for key, value in self.saved_values.items())
+
+    def save(self, state: Mapping[str, Any]) -> int:
+        connection = self.connect()
+        if self.saved_values is None:
+            self.saved_values = self.read_values()
+
+        encoded_values = dict(
+            (key, codecs.encode(value, self.codec)) for key, value in state.items()
+        )
+        changed_items = [
+            (key, value)
+            for key, value in encoded_values.items()
+            if self.saved_values.get(key) != value
+        ]
+        removed_keys = [(key,) for key in self.saved_values if key not in encoded_values]
+
+        if changed_items or removed_keys:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", changed_items
+                )
+                connection.executemany("DELETE FROM state WHERE key = ?", removed_keys)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+        self.saved_values = encoded_values
+        return sum(len(value) for key, value in changed_items)
+
+
+STATE_STORES = {
+    "file": FileStateStore,
+    "sqlite": SqliteStateStore,
+}
+
+
+def configure(state_settings: Optional[Mapping]) -> None:
+    """
+    Defines where and how the states are stored, using the key `state` from the settings. Eg:
+
+      "state": {"directory": "/var/lib/live-agent", "backend": "sqlite", "codec": "pickle"}
+    """
+    global state_directory, state_backend, state_codec, state_write_behind, state_flush_interval
+
+    state_settings = state_settings or {}
+    backend = state_settings.get("backend", "sqlite")
+    if backend not in STATE_STORES:
+        raise ValueError(f"Invalid state backend {backend}, use one of {list(STATE_STORES)}")
+
+    codec = state_settings.get("codec", "dill")
+    codecs.get_codec(codec)
+
+    state_directory = state_settings.get("directory", LEGACY_DIRECTORY)
+    state_backend = backend
+    state_codec = codec
+    state_write_behind = state_settings.get("write_behind", False)
+    state_flush_interval = state_settings.get("flush_interval", 0.5)
+
+
+def copy_state(state: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    A deep copy of the state. A round trip through pickle is much faster than `deepcopy`,
+    which is used for the values pickle does not support
+    """
+    try:
+        return pickle.loads(pickle.dumps(dict(state), protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return deepcopy(dict(state))
 
 
 class StateManager(object):
-    def __init__(self, name: AnyStr, delay_between_updates: number = 60):
+    def __init__(
+        self,
+        name: AnyStr,
+        delay_between_updates: number = 60,
+        directory: Optional[str] = None,
+        backend: Optional[str] = None,
+        codec: Optional[str] = None,
+        write_behind: Optional[bool] = None,
+        flush_interval: Optional[number] = None,
+    ):
         self.name = name
         self.delay_between_updates = delay_between_updates
         self.updated_at = 0
+        self.pending_state = None
 
         if isinstance(name, str):
             name = bytes(name, "utf-8")
 
         self.identifier = md5(name).hexdigest()
-        self.filename = f"/tmp/{self.identifier}.{name.decode('utf-8')}.live_agent"
+        basename = f"{self.identifier}.{name.decode('utf-8')}"
+        self.filename = os.path.join(LEGACY_DIRECTORY, f"{basename}.live_agent")
 
-    def load(self) -> Dict[str, Any]:
-        state_filename = self.filename
+        self.directory = directory or state_directory
+        self.backend = backend or state_backend
+        self.codec = codec or state_codec
+        os.makedirs(self.directory, exist_ok=True)
+        self.store = STATE_STORES[self.backend](self.directory, basename, codec=self.codec)
+
+        self.write_behind = state_write_behind if write_behind is None else write_behind
+        self.flush_interval = state_flush_interval if flush_interval is None else flush_interval
+        self.condition = threading.Condition()
+        # Reentrant, since SIGTERM may interrupt a load or save which is then followed by `flush`
+        self.write_lock = threading.RLock()
+        self.flusher = None
+        self.derived_managers: Dict[str, "StateManager"] = {}
 
+    def derive(self, suffix: str) -> "StateManager":
+        """
+        A manager for another part of the state of the same process (like the window of a monitor),
+        saved separately as `<name>.<suffix>` using the same settings
+        """
+        manager = self.derived_managers.get(suffix)
+        if manager is None:
+            name = self.name.decode("utf-8") if isinstance(self.name, bytes) else self.name
+            manager = StateManager(
+                f"{name}.{suffix}",
+                delay_between_updates=self.delay_between_updates,
+                directory=self.directory,
+                backend=self.backend,
+                codec=self.codec,
+                write_behind=self.write_behind,
+                flush_interval=self.flush_interval,
+            )
+            self.derived_managers[suffix] = manager
+
+        return manager
+
+    def load(self) -> Dict[str, Any]:
         try:
-            with open(state_filename, r"r+b") as f:
-                state = dill.load(f)
+            with self.write_lock:
+                state = self.store.load()
         except Exception:
             state = {}
 
+        if not state and (self.store.filename != self.filename):
+            state = self.load_legacy()
+
         self.updated_at = state.get(TIMESTAMP_KEY, self.updated_at)
 
         logging.info(f"State for {self.identifier} ({len(state)} keys) loaded")
         return state
 
+    def load_legacy(self) -> Dict[str, Any]:
+        """
+        Reads the state saved by older versions, which is migrated on the next save
+        """
+        try:
+            with open(self.filename, r"r+b") as f:
+                state = dill.load(f)
+        except Exception:
+            state = {}
+        else:
+            logging.info(f"Migrating the state for {self.identifier} from {self.filename}")
+
+        return state
+
     def save(self, state: Mapping[str, Any], force: bool = False) -> None:
+        if self.write_behind:
+            return self.save_later(state)
+
         now = time.time()
         next_possible_update = self.updated_at + self.delay_between_updates
         time_until_update = next_possible_update - now
 
         if (time_until_update > 0) and (not force):
-            logging.debug(f"Update for {self.identifier} dropped. Wait {time_until_update:.2f}s")
+            logging.debug(f"Update for {self.identifier} delayed. Wait {time_until_update:.2f}s")
+            self.pending_state = state
         else:
+            self.pending_state = None
             self.do_save(state, timestamp=now)
 
         return
 
+    def save_later(self, state: Mapping[str, Any]) -> None:
+        """
+        Hands the state to a background thread, which saves the latest state
+        at most once every `flush_interval` seconds
+        """
+        # The nested values may still be updated by the caller while the thread encodes them
+        snapshot = copy_state(state)
+        with self.condition:
+            self.pending_state = snapshot
+
+            # Threads do not survive forks, so this is also true on forked processes
+            if (self.flusher is None) or (not self.flusher.is_alive()):
+                self.flusher = threading.Thread(
+                    target=self.run_flusher, name=f"state-flusher-{self.identifier}", daemon=True
+                )
+                self.flusher.start()
+
+            self.condition.notify()
+
+    def run_flusher(self) -> None:
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending_state is not None)
+
+            try:
+                self.flush()
+            except Exception as e:
+                logging.warn(f"Error saving the state for {self.identifier}: {e}")
+
+            time.sleep(self.flush_interval)
+
+    def flush(self) -> None:
+        """
+        Saves the latest state which was delayed by `delay_between_updates`
+        (or is waiting for the write-behind thread), if any, including the derived managers
+        """
+        for manager in list(self.derived_managers.values()):
+            manager.flush()
+
+        with self.write_lock:
+            with self.condition:
+                state, self.pending_state = self.pending_state, None
+
+            if state is None:
+                return
+
+            try:
+                self.do_save(state, timestamp=time.time())
+            except BaseException:
+                # Keep the state for the next attempt, unless a newer one has arrived
+                with self.condition:
+                    if self.pending_state is None:
+                        self.pending_state = state
+                raise
+
     def do_save(self, state: Mapping[str, Any], timestamp: number) -> None:
-        state_filename = self.filename
+        started_at = time.monotonic()
         state.update(TIMESTAMP_KEY=timestamp)
 
-        with open(state_filename, r"w+b") as f:
-            dill.dump(state, f)
+        bytes_written = self.store.save(state)
 
         self.updated_at = timestamp
-        logging.debug(f"State for {self.identifier} saved")
+        logging.debug(f"State for {self.identifier} saved ({bytes_written} bytes written)")
+
+        metrics.inc("state_saves_total")
+        metrics.inc("state_save_seconds_total", time.monotonic() - started_at)
+        metrics.inc("state_bytes_written_total", bytes_written)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from contextlib import nullcontext
+from random import random
+from typing import Mapping, Optional
+
+import eliot
+
+__all__ = ["configure", "is_sampled", "start_action"]
+
+# Fraction of the actions of each type which are logged
+sampling_rates = {}
+default_rate = 1.0
+
+
+class UnsampledAction:
+    """
+    Stands for an action which was not sampled, with the interface used by `live_agent`
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def context(self):
+        return nullcontext(self)
+
+    def serialize_task_id(self) -> None:
+        return None
+
+    def add_success_fields(self, **fields) -> None:
+        pass
+
+    def log(self, *args, **kwargs) -> None:
+        pass
+
+    def finish(self, exception: Optional[BaseException] = None) -> None:
+        pass
+
+
+UNSAMPLED_ACTION = UnsampledAction()
+
+
+def configure(logging_settings: Optional[Mapping]) -> None:
+    """
+    Defines the sampling rates, using the key `sampling` from the logging settings. Eg:
+
+      "sampling": {"process_message": 0.01, "start_chatbot": 1, "default": 1}
+    """
+    global sampling_rates, default_rate
+
+    sampling_settings = dict((logging_settings or {}).get("sampling", {}))
+    default_rate = sampling_settings.pop("default", 1.0)
+    sampling_rates = sampling_settings
+
+
+def is_sampled(action_type: str) -> bool:
+    rate = sampling_rates.get(action_type, default_rate)
+    return (rate >= 1) or ((rate > 0) and (random() < rate))
+
+
+def start_action(action_type: str, **fields):
+    """
+    Same as `eliot.start_action`, but only for the sampled fraction of the actions.
+    Unsampled actions cost a dict lookup and a random number.
+    """
+    if is_sampled(action_type):
+        return eliot.start_action(action_type=action_type, **fields)
+
+    return UNSAMPLED_ACTION
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import os
+import gc
+from typing import Mapping
+
+from live_client.utils import logging
+
+from .importer import load_enabled_modules, list_handler_modules, log_and_import
+
+__all__ = ["preload", "is_enabled"]
+
+# Set on the process which preloaded the modules, which acts as a template for the others
+is_template = False
+
+
+def is_enabled(global_settings: Mapping) -> bool:
+    return global_settings.get("zygote", {}).get("enabled", False) is True
+
+
+def list_preloads(global_settings: Mapping) -> list:
+    names = list(global_settings.get("zygote", {}).get("preload", []))
+    for module in load_enabled_modules(global_settings):
+        names.extend(getattr(module, "PRELOAD", []))
+        # Handlers declared as import paths are resolved here, instead of on each process
+        names.extend(list_handler_modules(getattr(module, "PROCESSES", {})))
+
+    return names
+
+
+def preload(global_settings: Mapping) -> bool:
+    """
+    Turns the current process into a template for the processes forked from it.
+
+    Imports the heavy dependencies of the enabled modules (their `PRELOAD` lists and
+    the key `zygote.preload` from the settings) and freezes the garbage collector,
+    so the children share the preloaded objects copy-on-write.
+    """
+    global is_template
+
+    if not is_enabled(global_settings):
+        return False
+
+    gc.disable()
+    names = list_preloads(global_settings)
+    for name in names:
+        log_and_import(name)
+
+    # Frozen only once, freezing before each fork would also keep the garbage of each restart
+    gc.collect()
+    gc.freeze()
+    gc.enable()
+
+    is_template = True
+    os.register_at_fork(after_in_child=after_fork_in_child)
+    logging.info(f"Zygote ready, {len(names)} modules preloaded ({gc.get_freeze_count()} objects)")
+    return True
+
+
+def after_fork_in_child() -> None:
+    global is_template
+    is_template = False
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
-from .datasources import krakenfx
-from .monitors import trade_frequency
-
-PROCESSES = {"krakenfx": krakenfx.start, "trade_frequency": trade_frequency.start}
+# The handlers are imported only by the processes which use them
+PROCESSES = {
+    "krakenfx": f"{__name__}.datasources.krakenfx:start",
+    "trade_frequency": f"{__name__}.monitors.trade_frequency:start",
+}
 REQUIREMENTS = {}
+PRELOAD = ["websockets"]
@@ -6,17 +6,17 @@ import json
 from multiprocessing import Process, Queue
 
 import websockets
-from eliot import start_action
 
 from live_client.events import raw
 from live_client.utils import logging
+from live_agent.services import metrics, tracing
 
 __all__ = ["start"]
 
 
 async def read_results(url, pairs, output_queue):
     setproctitle("krakenfx: reading updates")
-    with start_action(action_type="krakenfx.fetch_updates", url=url):
+    with tracing.start_action("krakenfx.fetch_updates", url=url):
         # connect to the server
         async with websockets.connect(url) as websocket:
             subscription = {"event": "subscribe", "subscription": {"name": "trade"}, "pair": pairs}
@@ -77,6 +77,9 @@ def start(settings, **kwargs):
             logging.exception(f"No results after {timeout} seconds")
             break
 
+        metrics.inc("events_received_total")
+        metrics.set_gauge("queue_depth", results_queue.qsize())
+
         # We are only interested in trade events
         is_trade = isinstance(trade_data, list) and len(trade_data) == 4
         if is_trade:
@@ -104,6 +107,7 @@ def start(settings, **kwargs):
 
             # And send to live
             raw.create(event_type, trade_event, settings)
+            metrics.inc("events_emitted_total")
 
             # Update this datasource's state with the last trade for each pair
             # This might be useful if you needed to restore this state
@@ -2,8 +2,8 @@
 from functools import partial
 
 from chatterbot.conversation import Statement  # NOQA
-from eliot import start_action
 
+from live_agent.services import tracing
 from live_agent.modules.chatbot.src.actions import CallbackAction
 from live_agent.modules.chatbot.logic_adapters.base import (
     BaseBayesAdapter,
@@ -76,7 +76,7 @@ class TradesCounterAdapter(BaseBayesAdapter, NLPAdapter, WithAssetAdapter):
         interval = self.find_interval_value(statement)
 
         if (interval is not None) and (int(interval) > 0):
-            with start_action(action_type=self.state_key, interval=interval):
+            with tracing.start_action(self.state_key, interval=interval):
                 response_text = self.run_query(interval)
 
         else:
@@ -1,19 +1,32 @@
 # -*- coding: utf-8 -*-
+import queue
+import asyncio
+from functools import partial
+from time import monotonic
+
 from setproctitle import setproctitle
 
 from live_client.utils import logging
-from live_client.query import on_event
+from live_client import query as live_query
 from live_client.events import messenger
 
-
 __all__ = ["start"]
 
 read_timeout = 120
+poll_interval = 0.5
+
+EVENT_TYPE_EVENT = "event"
+EVENT_TYPE_DESTROY = "destroy"
 
 
-def start(settings, **kwargs):
+async def start(settings, **kwargs):
+    """
+    A coroutine, so it can share the event loop of the async worker (`"execution": "async"`).
+    The requests to live, which are blocking, are made on the loop's default executor.
+    """
     logging.info("Trade frequency monitor started")
-    setproctitle("DDA: Trade frequency monitor")
+    if settings.get("execution") != "async":
+        setproctitle("DDA: Trade frequency monitor")
 
     monitor_settings = settings.get("monitor", {})
     window_duration = monitor_settings.get("window_duration", 60)
@@ -26,17 +39,59 @@ def start(settings, **kwargs):
     """
     span = f"last {window_duration} seconds"
 
-    @on_event(fr_query, settings, span=span, timeout=read_timeout)
-    def handle_events(event):
-        # Generate alerts whether the threshold was reached
-        # a new event means another threshold breach
-        event_content = event.get("data", {}).get("content", [])
+    loop = asyncio.get_running_loop()
+    results_process, results_queue = await loop.run_in_executor(
+        None,
+        partial(live_query.run, fr_query, settings, realtime=True, timeout=read_timeout, span=span),
+    )
 
-        for item in event_content:
-            template = "{} traded {} times over the last {} seconds"
-            message = template.format(item["pair"], int(item["count"]), window_duration)
-            messenger.send_message(message, timestamp=item["timestamp"], settings=settings)
+    try:
+        async for event in read_events(results_queue, read_timeout):
+            # Generate alerts whether the threshold was reached
+            # a new event means another threshold breach
+            event_content = event.get("data", {}).get("content", [])
+
+            for item in event_content:
+                template = "{} traded {} times over the last {} seconds"
+                message = template.format(item["pair"], int(item["count"]), window_duration)
+                await loop.run_in_executor(
+                    None,
+                    partial(
+                        messenger.send_message,
+                        message,
+                        timestamp=item["timestamp"],
+                        settings=settings,
+                    ),
+                )
+    finally:
+        # Release resources after the query ends
+        results_queue.close()
+        results_process.terminate()
+        results_process.join()
+
+
+async def read_events(results_queue, timeout):
+    """
+    Yields the events from the results of a query without blocking the event loop
+    """
+    deadline = monotonic() + timeout
+    while True:
+        try:
+            event = results_queue.get_nowait()
+        except queue.Empty:
+            if monotonic() > deadline:
+                logging.warn(f"No results after {timeout} seconds")
+                return
 
-        return
+            await asyncio.sleep(poll_interval)
+            continue
+        except EOFError as e:
+            logging.warn(f"Connection lost: {e}")
+            return
 
-    handle_events()
+        deadline = monotonic() + timeout
+        event_type = event.get("data", {}).get("type")
+        if event_type == EVENT_TYPE_EVENT:
+            yield event
+        elif event_type == EVENT_TYPE_DESTROY:
+            return
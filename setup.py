@@ -67,6 +67,8 @@ setup(
             "PyYAML>=3.12,<4.0",
         ],
         "las": ["lasio==0.23", "pandas==0.24.2", "scikit-learn>=0.20"],
+        "msgpack": ["msgpack>=1.0"],
+        "columnar": ["numpy>=1.16"],
     },
     zip_safe=False,
     python_requires=">=3.7",
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from live_agent.services.monitors.utils.query import handle_events
+
+SETTINGS = {
+    "monitor": {
+        "window_duration": 2,
+        "mnemonics": {"index": "TIME", "rop": "ROPA"},
+    }
+}
+
+
+def build_event(index):
+    return {"data": {"content": [{"TIME": index, "ROPA": index * 10}]}}
+
+
+def test_list_accumulator_is_updated_in_place():
+    accumulator = []
+    window_sizes = []
+    for index in range(1, 6):
+        handle_events(
+            build_event(index),
+            lambda window: window_sizes.append(len(window)),
+            SETTINGS,
+            accumulator,
+        )
+
+    assert window_sizes == [1, 2, 3, 3, 3]
+    assert [item["TIME"] for item in accumulator] == [3, 4, 5]
+
+
+def test_returned_window_is_reused():
+    window = None
+    for index in range(1, 6):
+        window = handle_events(build_event(index), lambda window: None, SETTINGS, window)
+
+    assert [item["TIME"] for item in window] == [3, 4, 5]
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+from live_agent.services.processes import RestartPolicy, build_restart_policy
+
+
+def test_restart_policy_ignores_unknown_keys():
+    policy = build_restart_policy({"max_delay": 30, "max_dealy": 10}, "monitor")
+
+    assert policy == RestartPolicy(max_delay=30)
+
+
+def test_restart_policy_defaults():
+    assert build_restart_policy({}, "monitor") == RestartPolicy()